@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+# =============================
+#   TRAFFICO SINTETICO
+# =============================
+
+MSS = 1448                  # Payload tipico di un segmento TCP su Ethernet
+COALESCE_MAX = 65160        # Segmenti uniti dalla scheda di rete (GRO/LRO)
+SIZES = {"1KB": 1024, "100KB": 100 * 1024, "5MB": 5 * 1024 * 1024}
+RESULTS_PATH = os.path.join("benchmarks", "results.jsonl")
+
+EFFECT_IDS = (1, 2, 3, 4, 5, 6, 10001, 10002, 10003, 10004)
+
+
+def make_item(rng, uid):
+    """Pezzo di equipaggiamento come nel protocollo: [UID, Slot, Rarità, Livello, ?, [Effetti], ?, [Gemma]]."""
+    effects = []
+    for eff_id in rng.sample(EFFECT_IDS, rng.randint(1, 4)):
+        base = rng.randint(1, 60)
+        effects.append([eff_id, base, [base + rng.randint(0, 30)]] if rng.random() < 0.5 else [eff_id, base])
+    gem = [rng.randint(1, 500), rng.randint(1, 10)] if rng.random() < 0.3 else []
+    return [uid, rng.randint(1, 6), rng.randint(1, 5), rng.randint(1, 70), 0, effects, 0, gem]
+
+
+def make_roster(rng, target_bytes, first_uid=1):
+    """Messaggio con comandanti (C) e castellani (B) di circa target_bytes byte serializzati."""
+    commanders, bailiffs = [], []
+    uid, size = first_uid, 40
+    while size < target_bytes:
+        owner = {"ID": len(commanders) + len(bailiffs) + 1, "EQ": []}
+        for _ in range(rng.randint(1, 6)):
+            owner["EQ"].append(make_item(rng, uid))
+            uid += 1
+        if rng.random() < 0.75:
+            owner.update({"N": f"Comandante {owner['ID']}", "L": rng.randint(1, 80),
+                          "GID": rng.choice((-1, rng.randint(1, 40)))})
+            commanders.append(owner)
+        else:
+            bailiffs.append(owner)
+        size += len(json.dumps(owner, separators=(",", ":"))) + 1
+    return {"C": commanders, "B": bailiffs}
+
+
+def frame(payload, command="gcl"):
+    """Messaggio nel formato SmartFox, con terminatore NUL come sul socket."""
+    return b"%xt%" + command.encode() + b"%1%0%" + json.dumps(payload, separators=(",", ":")).encode() + b"%\x00"
+
+
+def make_stream(messages, rng, reorder=0.05, duplicate=0.02, coalesce=0.1, isn=None):
+    """
+    Divide lo stream in segmenti (seq, payload) come li vedrebbe lo sniffer:
+    segmenti da MSS, a volte uniti (coalesce), a volte ritrasmessi (duplicate)
+    e a volte scambiati con il successivo (reorder).
+    """
+    stream = b"".join(messages)
+    seq0 = rng.randrange(2 ** 32) if isn is None else isn
+
+    segments = []
+    pos = 0
+    while pos < len(stream):
+        size = MSS
+        if rng.random() < coalesce:
+            size = rng.randrange(MSS, COALESCE_MAX, MSS)
+        segments.append(((seq0 + pos) % 2 ** 32, stream[pos:pos + size]))
+        pos += size
+
+    out = []
+    for seg in segments:
+        out.append(seg)
+        if rng.random() < duplicate:
+            out.append(seg) # Ritrasmissione
+    # Il primo segmento resta in testa (il flusso inizia dal SYN, non a metà messaggio)
+    # e ogni scambio salta il successivo, così un segmento non "scivola" lontano
+    i = 1
+    while i < len(out) - 1:
+        if rng.random() < reorder:
+            out[i], out[i + 1] = out[i + 1], out[i]
+            i += 1
+        i += 1
+    return out
+
+
+# =============================
+#   MISURE
+# =============================
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_reassembler(segments, keep=True):
+    """
+    Spinge i segmenti in un TcpStream; ritorna (secondi, latenze per messaggio, payload).
+    Con keep=False i payload non vengono conservati (misura della sola memoria di lavoro).
+    """
+    from packet_logic import StreamReassembler, TcpStream, PARSED_CACHE
+
+    # Il traffico sintetico ripete pochi roster: con PARSED_CACHE attiva si
+    # misurerebbero i suoi hit invece del parsing
+    saved = PARSED_CACHE.max_entries
+    PARSED_CACHE.max_entries = 0
+    try:
+        stream = TcpStream(StreamReassembler())
+        latencies, payloads = [], []
+        started = time.perf_counter()
+        for seq, data in segments:
+            t0 = time.perf_counter()
+            results = stream.add_segment(seq, data, "")
+            if results:
+                # Tempo del segmento che ha completato i messaggi, diviso tra di loro
+                elapsed = (time.perf_counter() - t0) / len(results)
+                for msg in results:
+                    latencies.append(elapsed)
+                    if keep:
+                        payloads.append(msg["payload"])
+        return time.perf_counter() - started, latencies, payloads
+    finally:
+        PARSED_CACHE.max_entries = saved
+
+
+def run_decoder(payloads):
+    """process_game_data su ogni payload; ritorna (secondi, latenze per messaggio, decodificati)."""
+    import decode_json
+    decode_json.VERBOSE = False
+
+    latencies, decoded = [], 0
+    started = time.perf_counter()
+    for payload in payloads:
+        t0 = time.perf_counter()
+        if decode_json.process_game_data(payload, "gcl"):
+            decoded += 1
+        latencies.append(time.perf_counter() - t0)
+    return time.perf_counter() - started, latencies, decoded
+
+
+def peak_memory(func, *args):
+    """Picco di memoria allocata da Python durante func (passata separata: tracemalloc rallenta)."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(name, seconds, latencies, count, total_bytes, peak):
+    return {
+        "stage": name,
+        "messages": count,
+        "seconds": round(seconds, 6),
+        "mb_per_sec": round(total_bytes / seconds / (1024 * 1024), 3) if seconds else 0.0,
+        "msg_per_sec": round(count / seconds, 1) if seconds else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "peak_mb": round(peak / (1024 * 1024), 3),
+    }
+
+
+def bench_size(label, size, budget, seed):
+    """Reassembler e decoder su messaggi di una dimensione (circa budget byte in totale)."""
+    rng = random.Random(seed)
+    count = max(3, budget // size)
+    rosters = [make_roster(rng, size, first_uid=i * 100000) for i in range(min(count, 8))]
+    messages = [frame(rosters[i % len(rosters)]) for i in range(count)]
+    segments = make_stream(messages, rng)
+    total_bytes = sum(len(m) for m in messages)
+
+    seconds, latencies, payloads = run_reassembler(segments)
+    if len(payloads) != count:
+        print(f"⚠️ {label}: ricostruiti {len(payloads)} messaggi su {count}")
+    peak = peak_memory(run_reassembler, segments, False)
+    reassembly = summarize("reassembler", seconds, latencies, len(payloads), total_bytes, peak)
+
+    seconds, latencies, decoded = run_decoder(payloads)
+    peak = peak_memory(run_decoder, payloads)
+    decoding = summarize("decoder", seconds, latencies, decoded, total_bytes, peak)
+
+    for res in (reassembly, decoding):
+        res.update({"size": label, "segments": len(segments)})
+    return [reassembly, decoding]
+
+
+# =============================
+#   STORICO E REGRESSIONI
+# =============================
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def load_previous(path, seed, budget_mb):
+    """Ultima esecuzione salvata con lo stesso traffico (stesso seme e budget), o None."""
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            run = json.loads(line)
+            if run.get("seed") == seed and run.get("budget_mb") == budget_mb:
+                last = run
+    return last
+
+
+def compare(previous, results, threshold):
+    """Confronta throughput e memoria con l'esecuzione precedente; ritorna le regressioni."""
+    old = {(r["size"], r["stage"]): r for r in previous["results"]}
+    regressions = []
+    for res in results:
+        before = old.get((res["size"], res["stage"]))
+        if not before:
+            continue
+        if before["mb_per_sec"] and res["mb_per_sec"] < before["mb_per_sec"] * (1 - threshold):
+            regressions.append(f"{res['size']} {res['stage']}: {before['mb_per_sec']} -> {res['mb_per_sec']} MB/s")
+        if before["peak_mb"] and res["peak_mb"] > before["peak_mb"] * (1 + threshold):
+            regressions.append(f"{res['size']} {res['stage']}: picco {before['peak_mb']} -> {res['peak_mb']} MB")
+    return regressions
+
+
+def print_table(results):
+    print(f"\n{'dim.':>6} {'stadio':<12} {'msg':>6} {'MB/s':>9} {'msg/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'picco MB':>9}")
+    for r in results:
+        print(f"{r['size']:>6} {r['stage']:<12} {r['messages']:>6} {r['mb_per_sec']:>9.2f} {r['msg_per_sec']:>10.1f} "
+              f"{r['latency_p50_ms']:>9.3f} {r['latency_p99_ms']:>9.3f} {r['peak_mb']:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark di StreamReassembler e process_game_data")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"Dimensioni da misurare ({', '.join(SIZES)})")
+    parser.add_argument("--budget-mb", type=float, default=10, help="Byte totali generati per dimensione (MB)")
+    parser.add_argument("--seed", type=int, default=42, help="Seme del generatore (stesso traffico tra versioni)")
+    parser.add_argument("--output", default=RESULTS_PATH, help="Storico dei risultati (JSONL)")
+    parser.add_argument("--no-save", action="store_true", help="Non salva i risultati")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Peggioramento che conta come regressione")
+    args = parser.parse_args(argv)
+
+    budget = int(args.budget_mb * 1024 * 1024)
+    results = []
+    for label in filter(None, args.sizes.split(",")):
+        if label not in SIZES:
+            parser.error(f"dimensione sconosciuta: {label}")
+        print(f"⏱️  Benchmark {label}...")
+        results.extend(bench_size(label, SIZES[label], budget, args.seed))
+
+    print_table(results)
+
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_revision(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "budget_mb": args.budget_mb,
+        "results": results,
+    }
+
+    previous = load_previous(args.output, args.seed, args.budget_mb)
+    if previous:
+        regressions = compare(previous, results, args.threshold)
+        print(f"\n🔁 Confronto con {previous.get('commit') or '?'} ({previous['timestamp']})")
+        for line in regressions:
+            print(f"   ⚠️ REGRESSIONE {line}")
+        if not regressions:
+            print("   ✅ Nessuna regressione")
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+        print(f"💾 Risultati aggiunti a {args.output}")
+    return run
+
+
+if __name__ == "__main__":
+    main()
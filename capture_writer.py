@@ -0,0 +1,696 @@
+import bisect
+import glob
+import gzip
+import itertools
+import json
+import mmap
+import os
+import queue
+import re
+import socket
+import struct
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+
+from packet_logic import CapturedPacket
+from payload_cache import PayloadCache
+
+# =============================
+#   SCRITTURA SU DISCO IN STREAMING
+# =============================
+
+_STOP = object()
+_UNSEEN = object()
+
+# Payload ricordati per file dalla deduplica: chi legge usa la stessa LRU e lo
+# stesso numero di voci, quindi risolve sempre i riferimenti che trova
+DEDUP_ENTRIES = 256
+
+# Indice a blocchi dei .jsonl.gz (sidecar .idx): ogni ~BLOCK_BYTES non compressi
+# un Z_FULL_FLUSH chiude un blocco di deflate decomprimibile da solo, e una voce
+# BLOCK_ENTRY ne registra timestamp minimo/massimo (epoch), offset compresso di
+# inizio e di fine e numero di record. Si legge solo la finestra che serve.
+BLOCK_ENTRY = struct.Struct("<ddQQI")
+BLOCK_BYTES = 1024 * 1024
+
+
+class CaptureWriter:
+    """
+    Scrive i record su disco da un thread in background.
+
+    Il thread di cattura fa solo un put_nowait() su una coda limitata; il writer
+    serializza ogni record come una riga JSON in un file gzip che viene ruotato
+    per dimensione o per tempo. La memoria resta costante per tutta la sessione.
+    Con index=True scrive anche l'indice a blocchi per la lettura per finestra.
+    """
+
+    def __init__(self, directory, prefix, max_bytes=64 * 1024 * 1024, rotate_seconds=3600,
+                 flush_seconds=2.0, queue_size=10000, dedup=False, index=False):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes          # Byte non compressi per file
+        self.rotate_seconds = rotate_seconds
+        self.flush_seconds = flush_seconds
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.files = []
+
+        # Con dedup un record con "digest" già scritto nello stesso file diventa
+        # {"timestamp", "command", "ref": digest}: ogni file resta autonomo
+        self._refs = PayloadCache("capture_refs", DEDUP_ENTRIES, float("inf")) if dedup else None
+        # Con index i record devono avere "timestamp" ISO (i messaggi del reassembler)
+        self.index = index
+        self._index = None
+        self._block = None     # [ts minimo, ts massimo, offset di inizio, record, byte]
+
+        self._file = None
+        self._file_bytes = 0
+        self._file_opened = 0.0
+        self._last_flush = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"writer-{prefix}", daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+        return self
+
+    def write(self, record):
+        """Accoda un record (dict o oggetto con to_dict). Non blocca mai la cattura."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"⚠️ Coda di scrittura '{self.prefix}' piena: {self.dropped} record scartati")
+
+    def close(self):
+        """Svuota la coda, chiude il file corrente e ritorna la lista dei file scritti."""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+        return self.files
+
+    # --- Thread di scrittura ---
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                self._flush()
+                continue
+
+            if record is _STOP:
+                break
+            try:
+                self._write_record(record)
+            except Exception as e:
+                # Un record non serializzabile non deve fermare il writer
+                self.dropped += 1
+                print(f"❌ Errore scrittura '{self.prefix}': {e}")
+
+        self._close_file()
+
+    def _write_record(self, record):
+        if hasattr(record, "to_dict"):
+            record = record.to_dict()
+
+        now = time.monotonic()
+        if self._file is None or self._file_bytes >= self.max_bytes \
+                or now - self._file_opened >= self.rotate_seconds:
+            self._rotate(now)
+
+        if self._index is not None and self._block is None:
+            # Subito dopo un Z_FULL_FLUSH: qui può ripartire la decompressione
+            self._block = [float("inf"), float("-inf"), self._file.fileobj.tell(), 0, 0]
+
+        key = record.get("digest") if self._refs is not None else None
+        if key is not None:
+            at = self._refs.get(key, _UNSEEN)
+            if at is _UNSEEN:
+                # Con l'indice ricordiamo il blocco dell'originale: chi legge da metà
+                # file risolve il riferimento decomprimendo solo quel blocco
+                self._refs.put(key, self._block[2] if self._block else None)
+            else:
+                ref = {"timestamp": record.get("timestamp"), "command": record.get("command")}
+                if at is not None:
+                    ref["at"] = at
+                ref["ref"] = key # In coda: i lettori lo cercano alla fine della riga
+                record = ref
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+        self._file.write(line)
+        self._file_bytes += len(line)
+        self.written += 1
+
+        if self._block is not None:
+            ts = datetime.fromisoformat(record["timestamp"]).timestamp()
+            block = self._block
+            block[0], block[1] = min(block[0], ts), max(block[1], ts)
+            block[3] += 1
+            block[4] += len(line)
+            if block[4] >= BLOCK_BYTES:
+                self._end_block()
+
+        if now - self._last_flush >= self.flush_seconds:
+            self._flush()
+
+    def _end_block(self):
+        if self._block is None:
+            return
+        self._file.flush(zlib.Z_FULL_FLUSH)
+        ts_min, ts_max, start, count, _ = self._block
+        self._index.write(BLOCK_ENTRY.pack(ts_min, ts_max, start, self._file.fileobj.tell(), count))
+        self._block = None
+
+    def _rotate(self, now):
+        self._close_file()
+        ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        path = os.path.join(self.directory, f"{self.prefix}_{ts}_{len(self.files):03d}.jsonl.gz")
+        self._file = gzip.open(path, "wb", compresslevel=6)
+        if self.index:
+            self._index = open(path + ".idx", "wb")
+        if self._refs is not None:
+            self._refs.clear()
+        self._file_bytes = 0
+        self._file_opened = now
+        self.files.append(path)
+
+    def _flush(self):
+        # Z_SYNC_FLUSH: anche dopo un crash il file è leggibile fino a questo punto
+        if self._file is not None:
+            self._file.flush()
+            if self._index is not None:
+                self._index.flush()
+        self._last_flush = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._end_block()
+            self._file.close()
+            self._file = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+class NullWriter:
+    """Stessa interfaccia di CaptureWriter, ma non scrive nulla (replay senza salvataggio)."""
+
+    def __init__(self):
+        self.dropped = 0
+        self.written = 0
+
+    def start(self):
+        return self
+
+    def write(self, record):
+        self.written += 1
+
+    def close(self):
+        return []
+
+
+
+# =============================
+#   FORMATO BINARIO COMPATTO
+# =============================
+#
+# File .gpk: intestazione MAGIC, poi record = RECORD_HEADER + payload grezzo.
+# Sidecar .gpk.idx: una voce INDEX_ENTRY per record (timestamp, offset, flusso),
+# in ordine di arrivo, quindi ordinata per timestamp e ricercabile con bisezione.
+
+MAGIC = b"GSPK\x01\x00\x00\x00"
+RECORD_HEADER = struct.Struct("<d4s4sHHBqI")     # ts, src, dst, sport, dport, proto, seq, len
+INDEX_ENTRY = struct.Struct("<dQ4s4sHH")         # ts, offset, src, dst, sport, dport
+PROTOCOLS = {"TCP": 6, "UDP": 17}
+PROTOCOL_NAMES = {v: k for k, v in PROTOCOLS.items()}
+
+
+class BinaryCaptureWriter(CaptureWriter):
+    """
+    Come CaptureWriter, ma scrive header + byte del payload senza JSON né
+    compressione, così il file può essere letto con mmap e indicizzato.
+    """
+
+    def __init__(self, directory, prefix, **kwargs):
+        super().__init__(directory, prefix, **kwargs)
+        self._index = None
+
+    def _write_record(self, pkt):
+        payload = pkt.data if isinstance(pkt.data, (bytes, bytearray)) else str(pkt.data).encode("utf-8")
+        ts = datetime.fromisoformat(pkt.timestamp).timestamp()
+        src = socket.inet_aton(pkt.src)
+        dst = socket.inet_aton(pkt.dst)
+
+        now = time.monotonic()
+        if self._file is None or self._file_bytes >= self.max_bytes \
+                or now - self._file_opened >= self.rotate_seconds:
+            self._rotate(now)
+
+        self._index.write(INDEX_ENTRY.pack(ts, self._file_bytes, src, dst, pkt.sport, pkt.dport))
+        seq = pkt.seq if pkt.seq is not None else -1
+        self._file.write(RECORD_HEADER.pack(ts, src, dst, pkt.sport, pkt.dport,
+                                            PROTOCOLS.get(pkt.protocol, 0), seq, len(payload)))
+        self._file.write(payload)
+        self._file_bytes += RECORD_HEADER.size + len(payload)
+        self.written += 1
+
+        if now - self._last_flush >= self.flush_seconds:
+            self._flush()
+
+    def _rotate(self, now):
+        self._close_file()
+        ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        path = os.path.join(self.directory, f"{self.prefix}_{ts}_{len(self.files):03d}.gpk")
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._index = open(path + ".idx", "wb")
+        self._file_bytes = len(MAGIC)
+        self._file_opened = now
+        self.files.append(path)
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._index.flush()
+        self._last_flush = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+
+class BinaryCapture:
+    """
+    Lettura di un file .gpk tramite mmap: nessun parsing del file intero,
+    si salta direttamente alla finestra temporale richiesta tramite l'indice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data_file = open(path, "rb")
+        self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} non è un file di cattura binario")
+
+        self._index_file = None
+        self._index = b""
+        if os.path.exists(path + ".idx") and os.path.getsize(path + ".idx"):
+            self._index_file = open(path + ".idx", "rb")
+            self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Voci complete (l'ultima può essere troncata se la sessione è caduta)
+        self._count = len(self._index) // INDEX_ENTRY.size
+        self._reach = None       # Massimo progressivo dei timestamp dell'indice
+        self._floor = None       # Minimo dei timestamp da ogni voce in poi
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        for handle in (self._data, self._data_file, self._index, self._index_file):
+            if hasattr(handle, "close"):
+                handle.close()
+
+    def entry(self, i):
+        """(timestamp, offset, (src, sport, dst, dport)) della i-esima voce d'indice."""
+        ts, offset, src, dst, sport, dport = INDEX_ENTRY.unpack_from(self._index, i * INDEX_ENTRY.size)
+        return ts, offset, (socket.inet_ntoa(src), sport, socket.inet_ntoa(dst), dport)
+
+    def _bounds(self):
+        """
+        L'indice segue l'ordine della coda del writer, non del tempo (più stadi
+        di dissezione o worker): massimo progressivo e minimo dei successivi
+        sono monotoni e delimitano le voci di una finestra anche fuori ordine.
+        """
+        if self._reach is None:
+            times = array("d", (e[0] for e in INDEX_ENTRY.iter_unpack(self._index[:self._count * INDEX_ENTRY.size])))
+            self._reach = array("d", itertools.accumulate(times, max))
+            floor = array("d", itertools.accumulate(reversed(times), min))
+            floor.reverse()
+            self._floor = floor
+        return self._reach, self._floor
+
+    def bisect(self, ts):
+        """Prima voce da cui possono esserci timestamp >= ts (tutte le precedenti sono < ts)."""
+        return bisect.bisect_left(self._bounds()[0], ts)
+
+    def _stop(self, ts):
+        """Prima voce da cui tutti i timestamp sono >= ts."""
+        return bisect.bisect_left(self._bounds()[1], ts)
+
+    def read_at(self, offset):
+        """Legge il record all'offset indicato e ritorna un CapturedPacket."""
+        ts, src, dst, sport, dport, proto, seq, length = RECORD_HEADER.unpack_from(self._data, offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > len(self._data):
+            return None # Record troncato
+        return CapturedPacket(datetime.fromtimestamp(ts).isoformat(), socket.inet_ntoa(src),
+                              socket.inet_ntoa(dst), sport, dport,
+                              PROTOCOL_NAMES.get(proto, str(proto)), self._data[start:start + length],
+                              seq if seq >= 0 else None)
+
+    def window(self, start=None, end=None, flow=None):
+        """
+        Pacchetti con start <= timestamp < end (secondi epoch) nell'ordine del file,
+        opzionalmente di una sola connessione (src, sport, dst, dport), in entrambe
+        le direzioni.
+        """
+        first = self.bisect(start) if start is not None else 0
+        stop = self._stop(end) if end is not None else self._count
+        if flow is not None:
+            flow = tuple(flow)
+            flows = (flow, (flow[2], flow[3], flow[0], flow[1]))
+        for i in range(first, stop):
+            ts, offset, key = self.entry(i)
+            if (start is not None and ts < start) or (end is not None and ts >= end):
+                continue
+            if flow is not None and key not in flows:
+                continue
+            pkt = self.read_at(offset)
+            if pkt is None:
+                break
+            yield pkt
+
+    def __iter__(self):
+        if self._count:
+            yield from self.window()
+            return
+        # Indice mancante: scansione sequenziale del file dati
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= len(self._data):
+            pkt = self.read_at(offset)
+            if pkt is None:
+                break
+            yield pkt
+            offset += RECORD_HEADER.size + len(pkt.data)
+
+
+# =============================
+#   LETTURA
+# =============================
+
+def read_records(path):
+    """
+    Itera i record di un file di cattura: .jsonl / .jsonl.gz (una riga per record)
+    oppure il vecchio formato .json (array indentato), oppure .gpk binario.
+    """
+    if path.endswith(".gpk"):
+        with BinaryCapture(path) as capture:
+            for pkt in capture:
+                yield pkt.to_dict()
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        if ".jsonl" in os.path.basename(path):
+            refs = _ref_table()
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    rec = json.loads(line)
+                    if "ref" in rec:
+                        payload = refs.get(rec["ref"])
+                        if payload is not None:
+                            rec = {"timestamp": rec["timestamp"], "command": rec.get("command"),
+                                   "payload": payload, "digest": rec["ref"]}
+                    elif "digest" in rec:
+                        refs.put(rec["digest"], rec.get("payload"))
+                    yield rec
+            except (json.JSONDecodeError, EOFError):
+                # File troncato (sessione interrotta bruscamente): teniamo quanto letto
+                return
+        else:
+            yield from iter_json_array(f)
+
+
+def read_raw_records(path):
+    """
+    Come read_records, ma per i file .jsonl restituisce le righe non decodificate:
+    chi legge può scartare i messaggi irrilevanti senza json.loads.
+    """
+    if ".jsonl" not in os.path.basename(path):
+        yield from read_records(path)
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    refs = _ref_table()
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield _resolve_raw(line, refs)
+        except EOFError:
+            return # File troncato: teniamo quanto letto
+
+
+# Campi scritti da json.dumps sul wrapper del reassembler: timestamp in testa,
+# impronta in coda; i riferimenti sono righe corte con soli tre campi
+_TIMESTAMP_PREFIX = '{"timestamp": "'
+_DIGEST_FIELD = re.compile(r'"digest": "([0-9a-f]{32})"}$')
+_REF_FIELD = re.compile(r'"ref": "([0-9a-f]{32})"}$')
+REF_LINE_MAX = 200
+
+
+def _ref_table():
+    return PayloadCache("capture_read_refs", DEDUP_ENTRIES, float("inf"))
+
+
+def _resolve_raw(line, refs):
+    """
+    Riga grezza con i riferimenti risolti: la riga originale con il timestamp
+    del riferimento. Le righe restano autonome (anche divise tra più worker).
+    """
+    if len(line) <= REF_LINE_MAX:
+        match = _REF_FIELD.search(line)
+        if match:
+            original = refs.get(match.group(1))
+            if original is None or not line.startswith(_TIMESTAMP_PREFIX):
+                return line
+            start = len(_TIMESTAMP_PREFIX)
+            end = line.index('"', start)
+            orig_end = original.index('"', start)
+            return original[:start] + line[start:end] + original[orig_end:]
+        return line
+    match = _DIGEST_FIELD.search(line, len(line) - 64)
+    if match:
+        refs.put(match.group(1), line)
+    return line
+
+
+# =============================
+#   LETTURA PER FINESTRA TEMPORALE
+# =============================
+
+INFLATE_CHUNK = 256 * 1024
+# Dopo l'ultimo blocco di un file chiuso restano solo il blocco finale vuoto e il
+# trailer gzip: oltre questa soglia c'è una coda non indicizzata (sessione caduta)
+TAIL_SLACK = 64
+_AT_FIELD = re.compile(r'"at": (\d+), "ref"')
+
+
+def read_block_index(path):
+    """Voci complete del sidecar .idx di un .jsonl.gz: [(ts min, ts max, inizio, fine, record)]."""
+    idx = path + ".idx"
+    if not os.path.exists(idx):
+        return []
+    with open(idx, "rb") as f:
+        data = f.read()
+    return [BLOCK_ENTRY.unpack_from(data, i)
+            for i in range(0, len(data) - BLOCK_ENTRY.size + 1, BLOCK_ENTRY.size)]
+
+
+def line_time(rec):
+    """Timestamp epoch di una riga grezza (o di un record già letto); None se manca."""
+    if isinstance(rec, str):
+        if not rec.startswith(_TIMESTAMP_PREFIX):
+            return None
+        start = len(_TIMESTAMP_PREFIX)
+        text = rec[start:rec.find('"', start)]
+    else:
+        text = rec.get("timestamp") if isinstance(rec, dict) else None
+    try:
+        return datetime.fromisoformat(text).timestamp() if text else None
+    except ValueError:
+        return None
+
+
+def capture_time_range(path):
+    """
+    (primo, ultimo) timestamp epoch dei messaggi di un file senza leggerlo tutto:
+    dall'indice a blocchi se c'è, altrimenti dal primo record (ultimo ignoto = inf).
+    None per un file vuoto.
+    """
+    entries = read_block_index(path)
+    if entries:
+        last = max(e[1] for e in entries)
+        if os.path.getsize(path) - entries[-1][3] > TAIL_SLACK:
+            last = float("inf")
+        return min(e[0] for e in entries), last
+    for rec in read_raw_records(path):
+        first = line_time(rec)
+        return (first if first is not None else float("-inf")), float("inf")
+    return None
+
+
+def _inflate_lines(f, offset, stop=None):
+    """Righe di un tratto di deflate grezzo che inizia a offset (dopo un Z_FULL_FLUSH)."""
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    pending = b""
+    pos = offset
+    while not inflater.eof and (stop is None or pos < stop):
+        # Seek a ogni lettura: lo stesso file serve anche a risolvere i riferimenti
+        f.seek(pos)
+        chunk = f.read(INFLATE_CHUNK if stop is None else min(INFLATE_CHUNK, stop - pos))
+        if not chunk:
+            break
+        pos += len(chunk)
+        try:
+            lines = (pending + inflater.decompress(chunk)).split(b"\n")
+        except zlib.error:
+            return # Coda troncata o corrotta: teniamo quanto letto
+        pending = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line.decode("utf-8")
+    if pending.strip():
+        yield pending.strip().decode("utf-8")
+
+
+def _find_original(f, at, stop, digest):
+    suffix = f'"digest": "{digest}"}}'
+    for line in _inflate_lines(f, at, stop):
+        if line.endswith(suffix):
+            return line
+    return None
+
+
+def read_window(path, start=None, end=None):
+    """
+    (timestamp epoch, riga grezza) dei messaggi con start <= timestamp < end,
+    riferimenti della deduplica risolti. Con l'indice a blocchi si decomprimono
+    solo i blocchi che si sovrappongono alla finestra (più l'eventuale coda non
+    indicizzata); senza indice il file viene letto per intero e filtrato.
+    """
+    entries = read_block_index(path) if path.endswith(".jsonl.gz") else []
+    if not entries:
+        for rec in read_raw_records(path):
+            t = line_time(rec)
+            if t is not None and (start is None or t >= start) and (end is None or t < end):
+                yield t, rec
+        return
+
+    # Il massimo progressivo è crescente anche se i blocchi si sovrappongono un po'
+    # (più worker scrivono in parallelo): bisezione sul primo blocco utile
+    reach = list(itertools.accumulate((e[1] for e in entries), max))
+    first = bisect.bisect_left(reach, start) if start is not None else 0
+    ranges = [(e[2], e[3]) for e in entries[first:]
+              if (end is None or e[0] < end) and (start is None or e[1] >= start)]
+    if os.path.getsize(path) - entries[-1][3] > TAIL_SLACK:
+        ranges.append((entries[-1][3], None))
+    block_end = {e[2]: e[3] for e in entries}
+
+    refs = _ref_table()
+    with open(path, "rb") as f:
+        for begin, stop in ranges:
+            for line in _inflate_lines(f, begin, stop):
+                resolved = _resolve_raw(line, refs)
+                if resolved is line and len(line) <= REF_LINE_MAX:
+                    # Riferimento a un blocco fuori finestra: decomprimiamo solo quello
+                    at, ref = _AT_FIELD.search(line), _REF_FIELD.search(line)
+                    if at and ref:
+                        original = _find_original(f, int(at.group(1)), block_end.get(int(at.group(1))),
+                                                  ref.group(1))
+                        if original is not None:
+                            refs.put(ref.group(1), original)
+                            resolved = _resolve_raw(line, refs)
+                t = line_time(resolved)
+                if t is None or (start is not None and t < start) or (end is not None and t >= end):
+                    continue
+                yield t, resolved
+
+
+_WHITESPACE = " \t\r\n"
+
+
+def iter_json_array(f, chunk_size=1024 * 1024):
+    """
+    Legge un array JSON un elemento alla volta, senza caricare il file intero:
+    in memoria resta solo il blocco corrente più l'elemento in decodifica.
+    Un file con un singolo oggetto (non array) viene restituito come unico record.
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    eof = not buf
+    pos = 0
+
+    # Salta gli spazi iniziali per capire se è un array
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buf) or eof:
+            break
+        buf, pos = f.read(chunk_size), 0
+        eof = not buf
+
+    if pos >= len(buf):
+        return
+    if buf[pos] != "[":
+        yield json.loads(buf[pos:] + f.read())
+        return
+    pos += 1
+
+    while True:
+        # Separatori tra gli elementi
+        while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] == ","):
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+
+        if pos < len(buf):
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                pass
+            else:
+                # Se l'elemento termina a fine buffer potrebbe essere un numero troncato
+                if end < len(buf) or eof:
+                    yield item
+                    pos = end
+                    continue
+
+        if eof:
+            return # Array troncato (sessione interrotta): teniamo quanto letto
+
+        # Elemento incompleto: scartiamo la parte già consumata e leggiamo altro
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+
+def list_capture_files(directory):
+    """Tutti i file di cattura di una cartella, vecchi e nuovi formati."""
+    files = []
+    for pattern in ("*.json", "*.jsonl", "*.jsonl.gz", "*.gpk"):
+        files.extend(glob.glob(os.path.join(directory, pattern)))
+    return sorted(files)
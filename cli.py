@@ -0,0 +1,76 @@
+import argparse
+import importlib
+import os
+import sys
+
+# =============================
+#   RIGA DI COMANDO UNICA
+# =============================
+#
+# Ogni sottocomando importa il proprio modulo solo quando viene scelto:
+# decode/query/bench partono senza scapy, keyboard, pyautogui o numpy e
+# funzionano anche su un server senza sessione desktop.
+
+
+def capture(argv):
+    parser = argparse.ArgumentParser(prog=_prog("capture"),
+                                     description="Cattura live dal server di gioco (configurazione dal .env)")
+    parser.add_argument("--targets", help="Server, 'IP[:PORTA][@INTERFACCIA]' separati da virgole (TARGETS)")
+    parser.add_argument("--backend", choices=["scapy", "fast"], help="Backend di cattura (CAPTURE_BACKEND)")
+    parser.add_argument("--interface", help="Interfaccia dei target senza '@' (CAPTURE_INTERFACE)")
+    parser.add_argument("--workers", type=int, help="Processi di elaborazione (CAPTURE_WORKERS, 0 = core disponibili - 1)")
+    parser.add_argument("--format", choices=["bin", "jsonl"], help="Formato dei pacchetti grezzi (CAPTURE_FORMAT)")
+    parser.add_argument("--no-stream", action="store_true", help="Senza server di streaming (STREAM_SERVER=0)")
+    args = parser.parse_args(argv)
+
+    # sniffer_main legge la configurazione all'import: le opzioni passano dall'ambiente
+    # (load_dotenv non sovrascrive le variabili già impostate)
+    for name, value in (("TARGETS", args.targets), ("CAPTURE_BACKEND", args.backend),
+                        ("CAPTURE_INTERFACE", args.interface), ("CAPTURE_WORKERS", args.workers),
+                        ("CAPTURE_FORMAT", args.format)):
+        if value is not None:
+            os.environ[name] = str(value)
+    if args.no_stream:
+        os.environ["STREAM_SERVER"] = "0"
+
+    import sniffer_main
+    sniffer_main.main()
+
+
+# nome -> (descrizione, modulo con main(argv) oppure funzione)
+COMMANDS = {
+    "capture": ("Cattura live (scapy / AF_PACKET, hotkey e click dell'investigazione)", capture),
+    "replay": ("Replay offline di pcap/pcapng o dump raw nella pipeline", "replay"),
+    "decode": ("Decodifica l'inventario dai messaggi ricostruiti", "decode_json"),
+    "query": ("Database storico: ingest, top, items, history", "inventory_db"),
+    "windows": ("Statistiche per finestre temporali (fisse o scorrevoli) sulle catture", "windows"),
+    "loadout": ("Punteggio e ottimizzazione degli equipaggiamenti (numpy)", "loadout"),
+    "bench": ("Benchmark di reassembler e decoder", "bench"),
+}
+
+
+def _prog(command):
+    return f"{os.path.basename(sys.argv[0])} {command}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sniffer e strumenti offline per il protocollo del gioco",
+        epilog="Sottocomandi:\n" + "\n".join(f"  {name:<9} {text}" for name, (text, _) in COMMANDS.items())
+               + "\n\nOpzioni di un sottocomando: <sottocomando> --help",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS, metavar="sottocomando")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    target = COMMANDS[args.command][1]
+    if callable(target):
+        return target(args.args)
+
+    # I parser dei moduli prendono il nome del programma da sys.argv[0]
+    sys.argv[0] = _prog(args.command)
+    return importlib.import_module(target).main(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from collections import deque
+from datetime import datetime
+
+from metrics import METRICS
+
+# =============================
+#   CORRELAZIONE RICHIESTA / RISPOSTA
+# =============================
+
+
+def epoch(timestamp):
+    """Timestamp ISO dei messaggi -> secondi epoch."""
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+def connection_of(flow_key, from_server):
+    """Chiave di connessione comune alle due direzioni: (client, porta, server, porta)."""
+    src, sport, dst, dport = flow_key
+    return (dst, dport, src, sport) if from_server else flow_key
+
+
+class Correlator:
+    """
+    Accoppia ogni comando del client con le risposte del server che portano lo
+    stesso comando (SmartFox ripete l'identificativo nella risposta), per
+    connessione e in ordine FIFO. Registra il round-trip per tipo di comando.
+
+    - Risposte successive entro `followup` secondi si aggiungono allo stesso scambio
+    - Risposte senza richiesta in attesa sono "push" del server
+    - Richieste senza risposta entro `timeout` secondi sono "senza risposta"
+
+    Il tempo è quello dei messaggi (orario di cattura), quindi vale anche in replay.
+    on_exchange(exchange) viene chiamato alla prima risposta di ogni scambio.
+    """
+
+    def __init__(self, timeout=30.0, followup=1.0, on_exchange=None):
+        self.timeout = timeout
+        self.followup = followup
+        self.on_exchange = on_exchange
+        self.pending = {}       # (connessione, comando) -> deque di richieste
+        self.last = {}          # (connessione, comando) -> ultimo scambio
+        self.rtt = {}           # comando -> Histogram
+        self.counts = {}        # comando -> contatori
+        self.now = 0.0
+        self.last_sweep = 0.0
+
+    def _count(self, command, field, n=1):
+        counts = self.counts.get(command)
+        if counts is None:
+            counts = self.counts[command] = {"requests": 0, "responses": 0, "unanswered": 0, "pushes": 0}
+        counts[field] += n
+
+    def _tick(self, t):
+        if t > self.now:
+            self.now = t
+        if self.now - self.last_sweep > self.timeout:
+            self.expire()
+
+    def request(self, conn, messages):
+        """Messaggi ricostruiti dalla direzione client -> server."""
+        for msg in messages:
+            command = msg.get("command")
+            if not command:
+                continue
+            t = epoch(msg["timestamp"])
+            self.pending.setdefault((conn, command), deque()).append(
+                {"time": t, "timestamp": msg["timestamp"], "payload": msg["payload"]})
+            self._count(command, "requests")
+            self._tick(t)
+
+    def response(self, conn, messages, completed=None):
+        """
+        Messaggi ricostruiti dalla direzione server -> client. completed è l'orario
+        del segmento che li ha completati (fine dello scambio); di default l'inizio.
+        """
+        done = epoch(completed) if completed else None
+        for msg in messages:
+            command = msg.get("command")
+            if not command:
+                continue
+            t = epoch(msg["timestamp"])
+            end = done if done is not None else t
+            key = (conn, command)
+            queue = self.pending.get(key)
+
+            if queue:
+                req = queue.popleft()
+                if not queue:
+                    del self.pending[key]
+                exchange = {
+                    "connection": conn,
+                    "command": command,
+                    "request_time": req["time"],
+                    "response_time": t,
+                    "end_time": end,
+                    "rtt": t - req["time"],
+                    "request": req["payload"],
+                    "responses": [msg["payload"]],
+                }
+                self.last[key] = exchange
+                self._count(command, "responses")
+                histogram = self.rtt.get(command)
+                if histogram is None:
+                    histogram = self.rtt[command] = METRICS.histogram(f"rtt_{command}_seconds")
+                histogram.observe(max(exchange["rtt"], 0.0))
+                if self.on_exchange:
+                    self.on_exchange(exchange)
+            else:
+                last = self.last.get(key)
+                if last is not None and t - last["end_time"] <= self.followup:
+                    # Risposta in più parti: stesso scambio
+                    last["responses"].append(msg["payload"])
+                    last["end_time"] = end
+                else:
+                    self._count(command, "pushes")
+            self._tick(t)
+
+    def expire(self):
+        """Scarta le richieste rimaste senza risposta oltre il timeout."""
+        self.last_sweep = self.now
+        limit = self.now - self.timeout
+        for key in list(self.pending):
+            queue = self.pending[key]
+            while queue and queue[0]["time"] < limit:
+                queue.popleft()
+                self._count(key[1], "unanswered")
+            if not queue:
+                del self.pending[key]
+        for key in [k for k, ex in self.last.items() if ex["end_time"] < limit]:
+            del self.last[key]
+
+    def stats(self):
+        """Per comando: contatori e distribuzione del round-trip."""
+        result = {}
+        for command, counts in sorted(self.counts.items()):
+            result[command] = dict(counts)
+            if command in self.rtt:
+                result[command]["rtt"] = self.rtt[command].snapshot()
+        return result
+
+
+def format_rtt(stats):
+    """Tabella dei tempi di risposta per la console."""
+    lines = [f"{'comando':<16} {'rich.':>6} {'risp.':>6} {'push':>6} {'perse':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for command, s in stats.items():
+        rtt = s.get("rtt") or {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        lines.append(f"{command:<16} {s['requests']:>6} {s['responses']:>6} {s['pushes']:>6} {s['unanswered']:>6} "
+                     f"{rtt['p50'] * 1000:>9.1f} {rtt['p99'] * 1000:>9.1f} {rtt['max'] * 1000:>9.1f}")
+    return "\n".join(lines)
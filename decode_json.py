@@ -1,7 +1,17 @@
+import argparse
 import json
 import os
-import glob
+import re
+import sys
+from collections import deque
 from datetime import datetime
+from functools import lru_cache
+
+from capture_writer import read_raw_records, list_capture_files
+from payload_cache import PayloadCache
+
+# Cartella dei messaggi ricostruiti dallo sniffer (sovrascrivibile con --dir)
+REASSEMBLED_DIR = os.getenv("REASSEMBLED_DIR", os.path.join("captured_data", "reassembled"))
 
 # --- 1. CONFIGURAZIONE MAPPATURA ---
 
@@ -67,80 +77,188 @@ EFFECT_MAP = {
     30004: "Capacità Saccheggio"
 }
 
-# --- 2. FUNZIONI DI ANALISI ---
+# Stampa dettagliata del roster (disattivata in modalità delta / worker)
+VERBOSE = True
 
-def parse_effects(effect_list):
+def show(*args):
+    if VERBOSE:
+        print(*args)
+
+# --- 2. MODELLO COMPATTO E FUNZIONI DI ANALISI ---
+
+@lru_cache(maxsize=None)
+def effect_name(eff_id):
+    """Nome dell'effetto (stringa internata: una sola copia per ID)."""
+    return sys.intern(EFFECT_MAP.get(eff_id, f"Effetto[{eff_id}]"))
+
+@lru_cache(maxsize=None)
+def slot_name(slot_id):
+    return sys.intern(SLOT_MAP.get(slot_id, f"Slot {slot_id}"))
+
+def rarity_name(rarity_id):
+    return RARITY_MAP.get(rarity_id, "Sconosciuto")
+
+@lru_cache(maxsize=8192)
+def render_effect(eff_id, base_val, total_val, is_boosted):
+    """Stringa di presentazione, es. "Forza Mischia: +45% (Base 30%)" (memoizzata)."""
+    val_str = f"+{total_val}%"
+    if is_boosted and total_val != base_val:
+        val_str += f" (Base {base_val}%)"
+    return f"{effect_name(eff_id)}: {val_str}"
+
+class Effect:
+    """Effetto numerico di un equipaggiamento; il testo viene generato solo in output."""
+    __slots__ = ("effect_id", "base", "total", "boosted")
+
+    def __init__(self, effect_id, base, total, boosted):
+        self.effect_id = effect_id
+        self.base = base
+        self.total = total
+        self.boosted = boosted
+
+    @property
+    def name(self):
+        return effect_name(self.effect_id)
+
+    def render(self):
+        return render_effect(self.effect_id, self.base, self.total, self.boosted)
+
+    def key(self):
+        return (self.effect_id, self.base, self.total, self.boosted)
+
+    def __eq__(self, other):
+        return isinstance(other, Effect) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"Effect({self.effect_id}, {self.base}, {self.total})"
+
+class EquipmentItem:
+    """
+    Pezzo di equipaggiamento in forma compatta (solo ID numerici).
+    Nomi di slot/rarità/effetti sono lookup sulle mappe, calcolati quando servono.
+    """
+    __slots__ = ("uid", "slot_id", "rarity_id", "level", "has_gem", "effects")
+
+    def __init__(self, uid, slot_id, rarity_id, level, has_gem, effects):
+        self.uid = uid
+        self.slot_id = slot_id
+        self.rarity_id = rarity_id
+        self.level = level
+        self.has_gem = has_gem
+        self.effects = effects      # Tupla di Effect
+
+    @property
+    def slot_name(self):
+        return slot_name(self.slot_id)
+
+    @property
+    def rarity_name(self):
+        return rarity_name(self.rarity_id)
+
+    @property
+    def is_relic(self):
+        # Se è un pezzo Reliquia (Rarità 5) lo segniamo
+        return self.rarity_id == 5
+
+    def effect_strings(self):
+        return [eff.render() for eff in self.effects]
+
+    def key(self):
+        return (self.uid, self.slot_id, self.rarity_id, self.level, self.has_gem,
+                tuple(eff.key() for eff in self.effects))
+
+    def __eq__(self, other):
+        return isinstance(other, EquipmentItem) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"EquipmentItem(uid={self.uid}, slot={self.slot_id}, rarity={self.rarity_id})"
+
+    def to_dict(self):
+        """Forma leggibile (quella storica dei file processed_data)."""
+        return {
+            "uid": self.uid,
+            "slot_id": self.slot_id,
+            "slot_name": self.slot_name,
+            "rarity_id": self.rarity_id,
+            "rarity_name": self.rarity_name,
+            "level": self.level,
+            "is_relic": self.is_relic,
+            "has_gem": self.has_gem,
+            "effects": self.effect_strings()
+        }
+
+    def to_compact(self):
+        """Forma numerica: [uid, slot, rarità, livello, gemma, [[id, base, totale], ...]]."""
+        return [self.uid, self.slot_id, self.rarity_id, self.level, int(self.has_gem),
+                [[eff.effect_id, eff.base, eff.total] for eff in self.effects]]
+
+def parse_effect_list(effect_list):
     """
-    Converte la lista effetti.
+    Converte la lista effetti in oggetti Effect.
     Formato tipico input: [[ID, ValBase, [ValTotale]], [ID, ValBase]]
     """
     parsed = []
     if not effect_list:
-        return []
+        return ()
     
     for eff in effect_list:
         if isinstance(eff, list) and len(eff) >= 2:
-            eff_id = eff[0]
             base_val = eff[1]
             
             # Controllo se c'è un valore totale potenziato (indice 2, lista annidata)
-            total_val = base_val
-            is_boosted = False
-            
             if len(eff) > 2 and isinstance(eff[2], list) and len(eff[2]) > 0:
-                total_val = eff[2][0]
-                is_boosted = True
-
-            name = EFFECT_MAP.get(eff_id, f"Effetto[{eff_id}]")
-            
-            # Formattazione stringa valore
-            val_str = f"+{total_val}%"
-            if is_boosted and total_val != base_val:
-                val_str += f" (Base {base_val}%)"
-                
-            parsed.append(f"{name}: {val_str}")
+                parsed.append(Effect(eff[0], base_val, eff[2][0], True))
+            else:
+                parsed.append(Effect(eff[0], base_val, base_val, False))
             
-    return parsed
+    return tuple(parsed)
 
-def analyze_equipment(eq_item):
+def parse_effects(effect_list):
+    """Come parse_effect_list, ma ritorna direttamente le stringhe leggibili."""
+    return [eff.render() for eff in parse_effect_list(effect_list)]
+
+def parse_equipment(eq_item):
     """
-    Analizza un singolo pezzo di equipaggiamento.
+    Analizza un singolo pezzo di equipaggiamento e ritorna un EquipmentItem.
     Struttura attesa: [UID, Slot, Rarità, Livello, ?, [Lista Effetti], ...]
     """
     if not isinstance(eq_item, list) or len(eq_item) < 6:
         return None
     
     try:
-        slot_id = eq_item[1]
-        rarity_id = eq_item[2]
-        
-        slot_name = SLOT_MAP.get(slot_id, f"Slot {slot_id}")
-        rarity_name = RARITY_MAP.get(rarity_id, "Sconosciuto")
-        
         # Gli effetti sono solitamente all'indice 5
         raw_effects = eq_item[5]
-        effects_readable = parse_effects(raw_effects) if isinstance(raw_effects, list) else []
+        effects = parse_effect_list(raw_effects) if isinstance(raw_effects, list) else ()
         
         # Controllo rapido se ha una gemma (spesso indice 7 o annidata)
-        has_gem = False
-        if len(eq_item) > 7 and isinstance(eq_item[7], list) and len(eq_item[7]) > 0:
-            has_gem = True
+        has_gem = len(eq_item) > 7 and isinstance(eq_item[7], list) and len(eq_item[7]) > 0
         
-        # Se è un pezzo Reliquia (Rarità 5) o Eroe (Slot 6), lo segniamo
-        is_relic = (rarity_id == 5)
-        
-        return {
-            "slot_id": slot_id,
-            "slot_name": slot_name,
-            "rarity_id": rarity_id,
-            "rarity_name": rarity_name,
-            "is_relic": is_relic,
-            "has_gem": has_gem,
-            "effects": effects_readable
-        }
+        return EquipmentItem(eq_item[0], eq_item[1], eq_item[2], eq_item[3], has_gem, effects)
     except Exception:
         return None
 
+def analyze_equipment(eq_item):
+    """Versione leggibile di parse_equipment (dict con nomi ed effetti in testo)."""
+    item = parse_equipment(eq_item)
+    return item.to_dict() if item else None
+
+def to_json(obj):
+    """Hook per json.dump: gli oggetti compatti diventano dict leggibili."""
+    if isinstance(obj, EquipmentItem):
+        return obj.to_dict()
+    raise TypeError(f"Oggetto non serializzabile: {type(obj).__name__}")
+
+def to_compact_json(obj):
+    if isinstance(obj, EquipmentItem):
+        return obj.to_compact()
+    raise TypeError(f"Oggetto non serializzabile: {type(obj).__name__}")
+
 # --- 3. RICERCA E ESTRAZIONE ---
 
 def find_data_node(data):
@@ -169,160 +287,469 @@ def extract_items_list(node, key):
         return val
     return []
 
-def process_game_data(json_input):
-    extracted_data = {"commanders": [], "bailiffs": []}
-    
+# --- 3b. REGISTRO DEI TIPI DI MESSAGGIO ---
+
+COMMAND_DECODERS = {}   # Comando del protocollo (es. "%xt%<cmd>%") -> decoder
+MARKER_DECODERS = []    # (marcatori testuali, marcatori in byte, chiavi JSON, decoder)
+
+# Comandi che non hanno mai prodotto risultati: dopo MISS_LIMIT messaggi vengono
+# saltati senza guardare il payload (heartbeat, chat, ...). Un comando che ha
+# decodificato almeno una volta sta in COMMAND_DECODERS e non finisce mai qui.
+MISS_LIMIT = 32
+COMMAND_MISSES = {}
+SKIPPED_COMMANDS = set()
+
+# Profondità massima a cui cercare le chiavi dei marcatori in un payload già analizzato
+MARKER_KEY_DEPTH = 4
+
+# Il reassembler scrive "command" subito dopo "timestamp": basta guardare l'inizio della riga
+_COMMAND_FIELD = re.compile(r'"command":\s*"([A-Za-z0-9_]+)"')
+_TIMESTAMP_FIELD = re.compile(r'"timestamp":\s*"([^"]*)"')
+COMMAND_SCAN_LIMIT = 200
+_DIGEST_FIELD = re.compile(r'"digest":\s*"([0-9a-f]{32})"}$')
+
+# Risultati di process_game_data per impronta del payload (vedi packet_logic):
+# un roster ripetuto identico non viene decodificato di nuovo
+DECODED_CACHE = PayloadCache("decoded", max_entries=256)
+_UNDECODED = object()
+
+def register_decoder(commands=(), markers=()):
+    """
+    Registra un decoder per uno o più comandi e/o per i messaggi che contengono
+    tutti i marcatori testuali indicati (controllo economico prima di json.loads).
+    """
+    def wrap(decoder):
+        for command in commands:
+            COMMAND_DECODERS[command] = decoder
+        if markers:
+            # '"C"' è anche la chiave C per i payload già analizzati; altri marcatori non si verificano
+            keys = tuple(m[1:-1] for m in markers if len(m) > 2 and m[0] == m[-1] == '"')
+            keys = keys if len(keys) == len(markers) else None
+            MARKER_DECODERS.append((tuple(markers), tuple(m.encode() for m in markers), keys, decoder))
+        return decoder
+    return wrap
+
+def parsed_keys(data, depth=MARKER_KEY_DEPTH):
+    """Chiavi di tutti i dict raggiungibili entro depth livelli (liste comprese)."""
+    keys = set()
+    level = [data]
+    for _ in range(depth):
+        nested = []
+        for node in level:
+            if isinstance(node, dict):
+                keys.update(node)
+                nested.extend(v for v in node.values() if isinstance(v, (dict, list)))
+            else:
+                nested.extend(v for v in node if isinstance(v, (dict, list)))
+        if not nested:
+            break
+        level = nested
+    return keys
+
+def command_of(raw_line):
+    """Comando del messaggio letto dall'inizio della riga grezza, senza parsing."""
+    match = _COMMAND_FIELD.search(raw_line, 0, COMMAND_SCAN_LIMIT)
+    return match.group(1) if match else None
+
+def timestamp_of(raw_line):
+    """Timestamp del messaggio letto dall'inizio della riga grezza."""
+    match = _TIMESTAMP_FIELD.search(raw_line, 0, COMMAND_SCAN_LIMIT)
+    return match.group(1) if match else None
+
+def digest_of(raw_line):
+    """Impronta del payload letta dalla fine della riga grezza (None se assente)."""
+    match = _DIGEST_FIELD.search(raw_line, max(0, len(raw_line) - 64))
+    return match.group(1) if match else None
+
+def select_decoders(json_input, command=None):
+    """Decoder candidati per un messaggio; lista vuota = messaggio da saltare."""
+    if command in COMMAND_DECODERS:
+        return [COMMAND_DECODERS[command]]
+    if command in SKIPPED_COMMANDS:
+        return []
+    if isinstance(json_input, str):
+        return [d for markers, _, _, d in MARKER_DECODERS if all(m in json_input for m in markers)]
+    if isinstance(json_input, (bytes, bytearray)):
+        return [d for _, markers, _, d in MARKER_DECODERS if all(m in json_input for m in markers)]
+    # Già analizzato (stream live, replay --decode): i marcatori si cercano tra le chiavi
+    if not isinstance(json_input, (dict, list)):
+        return []
+    keys = parsed_keys(json_input)
+    return [d for _, _, wanted, d in MARKER_DECODERS if wanted is None or all(k in keys for k in wanted)]
+
+def _missed(command):
+    """Messaggio senza risultato: un comando che non decodifica mai viene saltato."""
+    if command is None or command in COMMAND_DECODERS:
+        return
+    misses = COMMAND_MISSES.get(command, 0) + 1
+    COMMAND_MISSES[command] = misses
+    if misses >= MISS_LIMIT:
+        SKIPPED_COMMANDS.add(command)
+
+def process_game_data(json_input, command=None):
     try:
-        data = json.loads(json_input) if isinstance(json_input, str) else json_input
-        root_node = find_data_node(data)
-        
-        if not root_node:
-            return None
-
-        commanders = extract_items_list(root_node, "C")
-        bailiffs = extract_items_list(root_node, "B")
-
-        # --- ELABORAZIONE COMANDANTI ---
-        if commanders:
-            print(f"\n✅ TROVATI {len(commanders)} COMANDANTI:")
-            for cmd in commanders:
-                if not isinstance(cmd, dict): continue
-                
-                # Logica Nome: Se 'N' è vuoto, usa l'ID
-                c_name = cmd.get('N', '')
-                c_id = cmd.get('ID')
-                if not c_name:
-                    c_name = f"Comandante {c_id}"
-                
-                # Livello Generale
-                gen_level = cmd.get('L', 0)
-                
-                # Generale Associato (GID)
-                gid = cmd.get('GID', -1)
-                has_general = "Sì" if gid > -1 else "No"
-                
-                print(f"   👑 {c_name} [ID: {c_id}]")
-                print(f"      Generale Livello: {gen_level} | Generale Associato: {has_general} (GID: {gid})")
-                
-                # Equipaggiamento
-                eq_raw = cmd.get("EQ", [])
-                # Normalizzazione EQ (potrebbe essere dict o list)
-                if isinstance(eq_raw, dict) and "items" in eq_raw: eq_raw = eq_raw["items"]
-                
-                cmd_obj = {
-                    "name": c_name,
-                    "id": c_id,
-                    "general_level": gen_level,
-                    "has_general": (gid > -1),
-                    "equipment": []
-                }
-
-                if not eq_raw:
-                    print("      ⚠️ Nessun equipaggiamento")
-                else:
-                    for item in eq_raw:
-                        info = analyze_equipment(item)
-                        if info:
-                            cmd_obj["equipment"].append(info)
-                            # Stampa user friendly
-                            eff_str = " | ".join(info['effects'][:2]) # Solo i primi 2 effetti per non intasare
-                            if len(info['effects']) > 2: eff_str += "..."
-                            
-                            gem_icon = "💎" if info['has_gem'] else ""
-                            print(f"      🔸 {info['slot_name']:<10} ({info['rarity_name']}) {gem_icon} -> {eff_str}")
-                
-                extracted_data["commanders"].append(cmd_obj)
-
-        # --- ELABORAZIONE CASTELLANI ---
-        if bailiffs:
-            print(f"\n✅ TROVATI {len(bailiffs)} CASTELLANI:")
-            for bai in bailiffs:
-                if not isinstance(bai, dict): continue
-                
-                b_id = bai.get('ID')
-                b_name = f"Castellano {b_id}" # I castellani raramente hanno nomi
-                
-                print(f"   🏰 {b_name} [ID: {b_id}]")
-                
-                eq_raw = bai.get("EQ", [])
-                if isinstance(eq_raw, dict) and "items" in eq_raw: eq_raw = eq_raw["items"]
-
-                bai_obj = {"name": b_name, "id": b_id, "equipment": []}
-
-                if not eq_raw:
-                    print("      ⚠️ Nessun equipaggiamento")
-                else:
-                    for item in eq_raw:
-                        info = analyze_equipment(item)
-                        if info:
-                            bai_obj["equipment"].append(info)
-                            eff_str = " | ".join(info['effects'][:2])
-                            gem_icon = "💎" if info['has_gem'] else ""
-                            print(f"      🔹 {info['slot_name']:<10} ({info['rarity_name']}) {gem_icon} -> {eff_str}")
-                
-                extracted_data["bailiffs"].append(bai_obj)
-
-        if not extracted_data["commanders"] and not extracted_data["bailiffs"]:
-            return None
-            
-        return extracted_data
+        decoders = select_decoders(json_input, command)
+        if not decoders:
+            _missed(command)
+            return None # Heartbeat, chat, ecc.: nessun json.loads
+
+        data = json.loads(json_input) if isinstance(json_input, (str, bytes, bytearray)) else json_input
+        for decoder in decoders:
+            result = decoder(data)
+            if result:
+                if command and command not in COMMAND_DECODERS:
+                    # Comando imparato: i prossimi messaggi uguali vanno diretti al decoder
+                    COMMAND_DECODERS[command] = decoder
+                    COMMAND_MISSES.pop(command, None)
+                return result
+        _missed(command)
+        return None
 
     except Exception as e:
         print(f"❌ Errore durante l'analisi: {e}")
         return None
 
-# --- 4. SALVATAGGIO E AVVIO ---
+# Comandi del roster noti in anticipo (es. "gcl,gbl"): vanno diretti al decoder
+ROSTER_COMMANDS = tuple(filter(None, (c.strip() for c in os.getenv("ROSTER_COMMANDS", "").split(","))))
 
-def save_processed_data(data):
-    base_dir = "processed_data"
-    if not os.path.exists(base_dir):
-        os.makedirs(base_dir)
+@register_decoder(commands=ROSTER_COMMANDS, markers=('"C"', '"B"'))
+def decode_roster(data):
+    """Decoder dei messaggi con la lista di comandanti (C) e castellani (B)."""
+    extracted_data = {"commanders": [], "bailiffs": []}
     
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"inventario_gge_{timestamp}.json"
-    filepath = os.path.join(base_dir, filename)
+    root_node = find_data_node(data)
     
+    if not root_node:
+        return None
+
+    commanders = extract_items_list(root_node, "C")
+    bailiffs = extract_items_list(root_node, "B")
+
+    # --- ELABORAZIONE COMANDANTI ---
+    if commanders:
+        show(f"\n✅ TROVATI {len(commanders)} COMANDANTI:")
+        for cmd in commanders:
+            if not isinstance(cmd, dict): continue
+            
+            # Logica Nome: Se 'N' è vuoto, usa l'ID
+            c_name = cmd.get('N', '')
+            c_id = cmd.get('ID')
+            if not c_name:
+                c_name = f"Comandante {c_id}"
+            
+            # Livello Generale
+            gen_level = cmd.get('L', 0)
+            
+            # Generale Associato (GID)
+            gid = cmd.get('GID', -1)
+            has_general = "Sì" if gid > -1 else "No"
+            
+            if VERBOSE:
+                show(f"   👑 {c_name} [ID: {c_id}]")
+                show(f"      Generale Livello: {gen_level} | Generale Associato: {has_general} (GID: {gid})")
+            
+            # Equipaggiamento
+            eq_raw = cmd.get("EQ", [])
+            # Normalizzazione EQ (potrebbe essere dict o list)
+            if isinstance(eq_raw, dict) and "items" in eq_raw: eq_raw = eq_raw["items"]
+            
+            cmd_obj = {
+                "name": c_name,
+                "id": c_id,
+                "general_level": gen_level,
+                "has_general": (gid > -1),
+                "equipment": []
+            }
+
+            if not eq_raw:
+                show("      ⚠️ Nessun equipaggiamento")
+            else:
+                for item in eq_raw:
+                    info = parse_equipment(item)
+                    if info:
+                        cmd_obj["equipment"].append(info)
+                        # Stampa user friendly (stringhe create solo se vanno a video)
+                        if VERBOSE:
+                            eff_str = " | ".join(eff.render() for eff in info.effects[:2]) # Solo i primi 2 effetti per non intasare
+                            if len(info.effects) > 2: eff_str += "..."
+
+                            gem_icon = "💎" if info.has_gem else ""
+                            show(f"      🔸 {info.slot_name:<10} ({info.rarity_name}) {gem_icon} -> {eff_str}")
+            
+            extracted_data["commanders"].append(cmd_obj)
+
+    # --- ELABORAZIONE CASTELLANI ---
+    if bailiffs:
+        show(f"\n✅ TROVATI {len(bailiffs)} CASTELLANI:")
+        for bai in bailiffs:
+            if not isinstance(bai, dict): continue
+            
+            b_id = bai.get('ID')
+            b_name = f"Castellano {b_id}" # I castellani raramente hanno nomi
+            
+            if VERBOSE:
+                show(f"   🏰 {b_name} [ID: {b_id}]")
+            
+            eq_raw = bai.get("EQ", [])
+            if isinstance(eq_raw, dict) and "items" in eq_raw: eq_raw = eq_raw["items"]
+
+            bai_obj = {"name": b_name, "id": b_id, "equipment": []}
+
+            if not eq_raw:
+                show("      ⚠️ Nessun equipaggiamento")
+            else:
+                for item in eq_raw:
+                    info = parse_equipment(item)
+                    if info:
+                        bai_obj["equipment"].append(info)
+                        if VERBOSE:
+                            eff_str = " | ".join(eff.render() for eff in info.effects[:2])
+                            gem_icon = "💎" if info.has_gem else ""
+                            show(f"      🔹 {info.slot_name:<10} ({info.rarity_name}) {gem_icon} -> {eff_str}")
+            
+            extracted_data["bailiffs"].append(bai_obj)
+
+    if not extracted_data["commanders"] and not extracted_data["bailiffs"]:
+        return None
+        
+    return extracted_data
+
+# --- 4. SALVATAGGIO E AVVIO ---
+
+def save_processed_data(data, compact=False):
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        print(f"\n💾 File JSON salvato con successo: {filepath}")
+        with ProcessedDataWriter(compact=compact) as writer:
+            for item in data:
+                writer.write(item)
+        print(f"\n💾 File JSON salvato con successo: {writer.filepath}")
     except Exception as e:
         print(f"❌ Errore nel salvataggio del file: {e}")
 
-def get_latest_file():
-    base_dir = "captured_data/reassembled"
+class ProcessedDataWriter:
+    """
+    Scrive l'array JSON dei risultati un elemento alla volta, man mano che
+    vengono decodificati: la memoria non cresce con la dimensione della cattura.
+    Il file viene creato solo al primo risultato. Con compact=True gli
+    equipaggiamenti restano numerici (senza nomi né stringhe degli effetti).
+    """
+
+    def __init__(self, base_dir="processed_data", compact=False, prefix="inventario_gge"):
+        self.base_dir = base_dir
+        self.prefix = prefix
+        self.compact = compact
+        self.filepath = None
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, item):
+        if self._file is None:
+            if not os.path.exists(self.base_dir):
+                os.makedirs(self.base_dir)
+            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            self.filepath = os.path.join(self.base_dir, f"{self.prefix}_{timestamp}.json")
+            self._file = open(self.filepath, "w", encoding="utf-8")
+            self._file.write("[\n")
+        elif self.count:
+            self._file.write(",\n")
+        if self.compact:
+            self._file.write(json.dumps(item, ensure_ascii=False, separators=(",", ":"),
+                                        default=to_compact_json))
+        else:
+            self._file.write(json.dumps(item, indent=4, ensure_ascii=False, default=to_json))
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.write("\n]\n")
+            self._file.close()
+            self._file = None
+
+def get_latest_file(base_dir=None):
+    base_dir = base_dir or REASSEMBLED_DIR
     if not os.path.exists(base_dir): return None
-    files = glob.glob(os.path.join(base_dir, "*.json"))
+    files = list_capture_files(base_dir)
     return max(files, key=os.path.getctime) if files else None
 
-if __name__ == "__main__":
-    latest_file = get_latest_file()
-    
-    if latest_file:
-        print(f"📂 Lettura file: {latest_file}")
-        all_data = []
-        
-        try:
-            with open(latest_file, 'r', encoding='utf-8') as f:
-                content = json.load(f)
-            
-            # Gestione file con messaggi multipli o singolo oggetto
-            if isinstance(content, list):
-                print(f"ℹ️  Il file contiene {len(content)} messaggi.")
-                for msg in content:
-                    # Prova a processare il payload, altrimenti il messaggio intero
-                    res = process_game_data(msg.get('payload', msg))
-                    if res: all_data.append(res)
-            else:
-                res = process_game_data(content)
-                if res: all_data.append(res)
-            
-            if all_data:
-                save_processed_data(all_data)
-            else:
-                print("\n⚠️ Nessun dato Comandante/Castellano trovato nel file.")
+def message_payload(msg):
+    """Prova a processare il payload, altrimenti il messaggio intero."""
+    return msg.get('payload', msg) if isinstance(msg, dict) else msg
+
+def decode_message(json_input, command=None, digest=None):
+    """process_game_data con i risultati riusati per i payload già visti (stessa impronta)."""
+    if digest is None:
+        return process_game_data(json_input, command)
+    cached = DECODED_CACHE.get(digest, _UNDECODED)
+    if cached is _UNDECODED:
+        cached = process_game_data(json_input, command)
+        DECODED_CACHE.put(digest, cached)
+    return cached
+
+def decode_record(rec):
+    """Decodifica una riga grezza (.jsonl) o un record già letto."""
+    if isinstance(rec, str):
+        return decode_message(rec, command_of(rec), digest_of(rec))
+    if not isinstance(rec, dict):
+        return process_game_data(rec)
+    return decode_message(message_payload(rec), rec.get('command'), rec.get('digest'))
+
+def record_timestamp(rec):
+    if isinstance(rec, str):
+        return timestamp_of(rec)
+    return rec.get('timestamp') if isinstance(rec, dict) else None
+
+def iter_decoded_with_time(path):
+    """Come iter_decoded, ma produce (timestamp del messaggio, risultato)."""
+    for rec in read_raw_records(path):
+        res = decode_record(rec)
+        if res: yield record_timestamp(rec), res
+
+def iter_decoded(path):
+    """Legge e decodifica un messaggio alla volta (streaming, memoria costante)."""
+    for _, res in iter_decoded_with_time(path):
+        yield res
+
+def decode_file(path):
+    """Decodifica tutti i messaggi di un file, nell'ordine del file."""
+    return list(iter_decoded(path))
+
+def decode_batch(messages):
+    results = []
+    for rec in messages:
+        res = decode_record(rec)
+        if res: results.append(res)
+    return results
+
+# --- 5. ELABORAZIONE PARALLELA ---
+
+BATCH_SIZE = 64
+
+def _init_worker():
+    # Le stampe dei processi worker si mescolerebbero: niente rendering né output
+    global VERBOSE
+    VERBOSE = False
+
+def _batches(paths, size):
+    batch = []
+    for path in paths:
+        for rec in read_raw_records(path):
+            batch.append(rec)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def _ordered_map(pool, fn, items, window):
+    """Come pool.map, ma con al massimo `window` task in volo (input letto pigramente)."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def iter_decoded_parallel(paths, workers):
+    """
+    Distribuisce il lavoro su un pool di processi e produce i risultati
+    nello stesso ordine dei file/messaggi in ingresso.
+    Con molti file ogni worker decodifica un file intero (niente pickling
+    dei messaggi); con pochi file grandi si distribuiscono lotti di messaggi.
+    """
+    from concurrent.futures import ProcessPoolExecutor
 
-        except Exception as e:
-            print(f"❌ Errore critico: {e}")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        if len(paths) >= workers:
+            for path, results in zip(paths, _ordered_map(pool, decode_file, paths, workers * 2)):
+                print(f"   ✔️ {path}: {len(results)} risultati")
+                yield from results
+        else:
+            for results in _ordered_map(pool, decode_batch, _batches(paths, BATCH_SIZE), workers * 4):
+                yield from results
+
+def decode_files_parallel(paths, workers):
+    return list(iter_decoded_parallel(paths, workers))
+
+def write_deltas(results, compact=False):
+    """Salva e stampa solo le differenze tra un messaggio e il successivo."""
+    global VERBOSE
+    from inventory_state import InventoryState, format_delta
+
+    VERBOSE = False
+    state = InventoryState()
+    with ProcessedDataWriter(compact=compact, prefix="delta_gge") as writer:
+        for res in results:
+            for delta in state.apply(res):
+                print(format_delta(delta))
+                writer.write(delta)
+
+    if writer.count:
+        print(f"\n💾 Differenze salvate: {writer.filepath} ({writer.count} modifiche)")
+    else:
+        print("\n⚠️ Nessuna modifica all'inventario trovata.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decodifica inventario da catture ricostruite")
+    parser.add_argument("files", nargs="*", help="File da decodificare (default: il più recente)")
+    parser.add_argument("--all", action="store_true", help="Tutti i file della cartella delle catture")
+    parser.add_argument("--dir", default=REASSEMBLED_DIR, help=f"Cartella delle catture (default: {REASSEMBLED_DIR})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processi paralleli (0 = tutti i core, 1 = sequenziale con output dettagliato)")
+    parser.add_argument("--deltas", action="store_true",
+                        help="Applica i messaggi a un inventario incrementale e salva solo le differenze")
+    parser.add_argument("--compact", action="store_true",
+                        help="Output numerico compatto (ID invece di nomi e stringhe degli effetti)")
+    args = parser.parse_args(argv)
+
+    if args.all:
+        paths = list_capture_files(args.dir)
+    elif args.files:
+        paths = args.files
     else:
-        print("❌ Nessun file JSON trovato nella cartella 'captured_data/reassembled'.")
\ No newline at end of file
+        latest_file = get_latest_file(args.dir)
+        paths = [latest_file] if latest_file else []
+
+    if not paths:
+        print(f"❌ Nessun file di cattura trovato nella cartella '{args.dir}'.")
+        return
+
+    workers = args.workers or os.cpu_count() or 1
+
+    def iter_sequential():
+        for path in paths:
+            print(f"📂 Lettura file: {path}")
+            # Vecchi file .json (array) o nuovi .jsonl.gz, letti un messaggio alla volta
+            yield from iter_decoded(path)
+
+    try:
+        if workers > 1:
+            print(f"⚙️  Decodifica di {len(paths)} file su {workers} processi...")
+            results = iter_decoded_parallel(paths, workers)
+        else:
+            results = iter_sequential()
+
+        if args.deltas:
+            write_deltas(results, args.compact)
+            return
+
+        # Ogni risultato va su disco appena pronto
+        with ProcessedDataWriter(compact=args.compact) as writer:
+            for res in results:
+                writer.write(res)
+
+        if writer.count:
+            print(f"\n💾 File JSON salvato con successo: {writer.filepath} ({writer.count} risultati)")
+        else:
+            print("\n⚠️ Nessun dato Comandante/Castellano trovato nel file.")
+
+    except Exception as e:
+        print(f"❌ Errore critico: {e}")
+
+if __name__ == "__main__":
+    main()
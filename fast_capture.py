@@ -0,0 +1,246 @@
+import socket
+import struct
+import threading
+import time
+from datetime import datetime
+
+from packet_logic import CapturedPacket
+
+# =============================
+#   PARSER HEADER IPv4/TCP/UDP
+# =============================
+#
+# Alternativa a scapy per la cattura: gli header vengono letti con struct
+# direttamente dal frame, senza costruire oggetti Packet/Layer.
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+
+ETH_P_ALL = 0x0003
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+
+_U16 = struct.Struct("!H")
+_PORTS_SEQ = struct.Struct("!HHI")
+_PORTS = struct.Struct("!HH")
+_TPACKET_STATS = struct.Struct("II")
+
+
+def ip_offset(frame, linktype):
+    """Offset dell'header IPv4 nel frame, oppure -1 se non è IPv4."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return -1
+        offset = 12
+        ethertype = _U16.unpack_from(frame, offset)[0]
+        while ethertype in ETHERTYPE_VLAN and len(frame) >= offset + 6:
+            offset += 4
+            ethertype = _U16.unpack_from(frame, offset)[0]
+        return offset + 2 if ethertype == ETHERTYPE_IPV4 else -1
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return -1
+        return 16 if _U16.unpack_from(frame, 14)[0] == ETHERTYPE_IPV4 else -1
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        return 0
+    if linktype == LINKTYPE_NULL:
+        return 4
+    return -1
+
+
+def parse_frame(frame, linktype=LINKTYPE_ETHERNET):
+    """
+    Estrae (src, dst, sport, dport, protocol, seq, flags, payload) da un frame.
+    src/dst restano 4 byte grezzi e payload è un memoryview: la conversione
+    avviene solo per i pacchetti che superano il filtro. None se non è IPv4 TCP/UDP.
+    """
+    view = memoryview(frame)
+    ip = ip_offset(view, linktype)
+    if ip < 0 or len(view) < ip + 20:
+        return None
+
+    version_ihl = view[ip]
+    if version_ihl >> 4 != 4:
+        return None
+    ihl = (version_ihl & 0x0F) * 4
+    total_len = _U16.unpack_from(view, ip + 2)[0]
+    proto = view[ip + 9]
+    src = view[ip + 12:ip + 16]
+    dst = view[ip + 16:ip + 20]
+
+    # Il padding Ethernet non fa parte del payload
+    end = min(len(view), ip + total_len) if total_len else len(view)
+    l4 = ip + ihl
+
+    if proto == 6:
+        if end < l4 + 20:
+            return None
+        sport, dport, seq = _PORTS_SEQ.unpack_from(view, l4)
+        data_offset = (view[l4 + 12] >> 4) * 4
+        flags = view[l4 + 13]
+        return src, dst, sport, dport, "TCP", seq, flags, view[l4 + data_offset:end]
+
+    if proto == 17:
+        if end < l4 + 8:
+            return None
+        sport, dport = _PORTS.unpack_from(view, l4)
+        return src, dst, sport, dport, "UDP", None, 0, view[l4 + 8:end]
+
+    return None
+
+
+def build_packet(parsed, ts):
+    """Converte il risultato di parse_frame nello stesso CapturedPacket della via scapy."""
+    src, dst, sport, dport, protocol, seq, flags, payload = parsed
+    pkt = CapturedPacket(datetime.fromtimestamp(ts).isoformat(), socket.inet_ntoa(src),
+                         socket.inet_ntoa(dst), sport, dport, protocol, bytes(payload), seq)
+    return pkt, flags
+
+
+class TargetFilter:
+    """Equivalente del filtro BPF 'tcp and host IP [and port P]', sui byte grezzi."""
+
+    def __init__(self, target_ip, target_port=None, protocol="TCP"):
+        self.target = socket.inet_aton(target_ip) if target_ip else None
+        self.port = int(target_port) if target_port else None
+        self.protocol = protocol
+
+    def match(self, parsed):
+        src, dst, sport, dport, protocol = parsed[:5]
+        if self.protocol and protocol != self.protocol:
+            return False
+        if self.target is not None and src != self.target and dst != self.target:
+            return False
+        if self.port is not None and sport != self.port and dport != self.port:
+            return False
+        return True
+
+
+class MultiTargetFilter:
+    """Come TargetFilter, per più server: [(ip, porta o None), ...] in OR."""
+
+    def __init__(self, targets, protocol="TCP"):
+        self.ports = {}          # IP (4 byte) -> porte ammesse, None = tutte
+        for ip, port in targets:
+            key = socket.inet_aton(ip)
+            if port is None or self.ports.get(key, ()) is None:
+                self.ports[key] = None
+            else:
+                self.ports.setdefault(key, set()).add(int(port))
+        self.protocol = protocol
+
+    def _side(self, ip, port):
+        ports = self.ports.get(bytes(ip), ())
+        return ports is None or port in ports
+
+    def match(self, parsed):
+        src, dst, sport, dport, protocol = parsed[:5]
+        if self.protocol and protocol != self.protocol:
+            return False
+        return self._side(src, sport) or self._side(dst, dport)
+
+
+# =============================
+#   SORGENTI DI FRAME
+# =============================
+
+def iter_pcap_frames(path):
+    """
+    Lettore pcap classico (non pcapng) senza scapy: (timestamp, frame, linktype).
+    """
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24:
+            return
+        magic = header[:4]
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            endian = ">"
+        else:
+            raise ValueError(f"{path} non è un file pcap classico")
+        nano = magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d")
+        divisor = 1e9 if nano else 1e6
+        linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+
+        record = struct.Struct(endian + "IIII")
+        while True:
+            rec = f.read(record.size)
+            if len(rec) < record.size:
+                break
+            ts_sec, ts_frac, incl_len, _orig_len = record.unpack(rec)
+            frame = f.read(incl_len)
+            if len(frame) < incl_len:
+                break # File troncato
+            yield ts_sec + ts_frac / divisor, frame, linktype
+
+
+def is_classic_pcap(path):
+    with open(path, "rb") as f:
+        return f.read(4) in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1",
+                             b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d")
+
+
+class FastSniffer:
+    """
+    Backend di cattura live con socket AF_PACKET (solo Linux): stessa interfaccia
+    start()/stop() di AsyncSniffer, ma prn riceve (CapturedPacket, flags TCP).
+    Con targets=[(ip, porta), ...] cattura più server con un solo socket.
+    """
+
+    def __init__(self, prn, target_ip=None, target_port=None, interface=None, bufsize=65535,
+                 targets=None):
+        self.prn = prn
+        self.filter = MultiTargetFilter(targets) if targets else TargetFilter(target_ip, target_port)
+        self.interface = interface
+        self.bufsize = bufsize
+        self.running = False
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        if not hasattr(socket, "AF_PACKET"):
+            raise RuntimeError("Il backend veloce richiede socket AF_PACKET (Linux)")
+        self._sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+        if self.interface:
+            self._sock.bind((self.interface, 0))
+        self._sock.settimeout(0.5)
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=f"fast-sniffer-{self.interface or 'all'}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join()
+        if self._sock:
+            self._sock.close()
+
+    def stats(self):
+        """(pacchetti ricevuti, pacchetti scartati dal kernel) dall'ultima lettura."""
+        raw = self._sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _TPACKET_STATS.size)
+        return _TPACKET_STATS.unpack(raw)
+
+    def _run(self):
+        buf = bytearray(self.bufsize)
+        match = self.filter.match
+        while self.running:
+            try:
+                n = self._sock.recv_into(buf)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            parsed = parse_frame(memoryview(buf)[:n], LINKTYPE_ETHERNET)
+            if parsed is None or not match(parsed):
+                continue
+            self.prn(*build_packet(parsed, time.time()))
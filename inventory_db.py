@@ -0,0 +1,306 @@
+import argparse
+import os
+import sqlite3
+from datetime import datetime
+
+import decode_json
+from capture_writer import list_capture_files
+from decode_json import EFFECT_MAP, SLOT_MAP, effect_name, slot_name, rarity_name
+
+# =============================
+#   DATABASE STORICO INVENTARIO
+# =============================
+
+DB_PATH = os.path.join("processed_data", "inventory.db")
+MAX_TS = "9999-12-31T23:59:59"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    snapshots INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS owners (
+    snapshot_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    owner_id INTEGER,
+    name TEXT,
+    general_level INTEGER
+);
+CREATE TABLE IF NOT EXISTS items (
+    snapshot_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    owner_id INTEGER,
+    uid INTEGER,
+    slot_id INTEGER,
+    rarity_id INTEGER,
+    level INTEGER,
+    has_gem INTEGER
+);
+CREATE TABLE IF NOT EXISTS effects (
+    snapshot_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    owner_id INTEGER,
+    uid INTEGER,
+    slot_id INTEGER,
+    rarity_id INTEGER,
+    effect_id INTEGER NOT NULL,
+    base REAL,
+    total REAL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots(timestamp);
+CREATE INDEX IF NOT EXISTS idx_snapshots_source ON snapshots(source);
+CREATE INDEX IF NOT EXISTS idx_owners_owner ON owners(kind, owner_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_items_owner ON items(kind, owner_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_items_slot ON items(slot_id, rarity_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_items_uid ON items(uid);
+CREATE INDEX IF NOT EXISTS idx_effects_effect ON effects(effect_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_effects_owner ON effects(kind, owner_id, effect_id);
+CREATE INDEX IF NOT EXISTS idx_owners_snapshot ON owners(snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_items_snapshot ON items(snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_effects_snapshot ON effects(snapshot_id);
+"""
+
+KINDS = {"commanders": "commander", "bailiffs": "bailiff"}
+
+
+def resolve_effect(value):
+    """ID effetto da numero o da nome (un nome può corrispondere a più ID)."""
+    if isinstance(value, int) or str(value).isdigit():
+        return [int(value)]
+    wanted = str(value).lower()
+    ids = [eff_id for eff_id, name in EFFECT_MAP.items() if name.lower() == wanted]
+    if not ids:
+        ids = [eff_id for eff_id, name in EFFECT_MAP.items() if wanted in name.lower()]
+    if not ids:
+        raise ValueError(f"Effetto sconosciuto: {value}")
+    return ids
+
+
+def resolve_slot(value):
+    if value is None or str(value).isdigit():
+        return None if value is None else int(value)
+    for slot_id, name in SLOT_MAP.items():
+        if name.lower() == str(value).lower():
+            return slot_id
+    raise ValueError(f"Slot sconosciuto: {value}")
+
+
+class InventoryDB:
+    """
+    Storico degli inventari decodificati in SQLite, con indici su proprietario,
+    slot, rarità, effetto e timestamp: le query storiche non aprono più i file.
+    """
+
+    def __init__(self, path=DB_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Caricamento ---
+
+    def add_snapshot(self, timestamp, decoded, source=None):
+        """Inserisce un risultato di process_game_data (senza commit)."""
+        cur = self.conn.execute("INSERT INTO snapshots (timestamp, source) VALUES (?, ?)", (timestamp, source))
+        snap = cur.lastrowid
+
+        owners, items, effects = [], [], []
+        for group, kind in KINDS.items():
+            for owner in decoded.get(group, []):
+                owner_id = owner.get("id")
+                owners.append((snap, timestamp, kind, owner_id, owner.get("name"), owner.get("general_level")))
+                for item in owner.get("equipment", []):
+                    items.append((snap, timestamp, kind, owner_id, item.uid, item.slot_id,
+                                  item.rarity_id, item.level, int(item.has_gem)))
+                    for eff in item.effects:
+                        effects.append((snap, timestamp, kind, owner_id, item.uid, item.slot_id,
+                                        item.rarity_id, eff.effect_id, eff.base, eff.total))
+
+        self.conn.executemany("INSERT INTO owners VALUES (?, ?, ?, ?, ?, ?)", owners)
+        self.conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", items)
+        self.conn.executemany("INSERT INTO effects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", effects)
+        return snap
+
+    def ingest_file(self, path, force=False):
+        """Decodifica e carica un file di cattura; i file già caricati vengono saltati."""
+        mtime = os.path.getmtime(path)
+        row = self.conn.execute("SELECT mtime FROM sources WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == mtime and not force:
+            return 0
+
+        fallback_ts = datetime.fromtimestamp(mtime).isoformat()
+        count = 0
+        with self.conn:
+            if row:
+                self._delete_source(path)
+            for ts, decoded in decode_json.iter_decoded_with_time(path):
+                self.add_snapshot(ts or fallback_ts, decoded, path)
+                count += 1
+            self.conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (path, mtime, count))
+        return count
+
+    def _delete_source(self, path):
+        ids = [r[0] for r in self.conn.execute("SELECT id FROM snapshots WHERE source = ?", (path,))]
+        for table in ("owners", "items", "effects"):
+            self.conn.executemany(f"DELETE FROM {table} WHERE snapshot_id = ?", [(i,) for i in ids])
+        self.conn.execute("DELETE FROM snapshots WHERE source = ?", (path,))
+
+    # --- Query ---
+
+    def top_owners(self, effect, start=None, end=None, kind="commander", limit=10):
+        """
+        Proprietari con il valore totale più alto di un effetto (somma su tutti
+        i pezzi equipaggiati, massimo tra gli snapshot nella finestra temporale).
+        """
+        ids = resolve_effect(effect)
+        marks = ",".join("?" * len(ids))
+        sql = f"""
+            SELECT e.owner_id, MAX(e.value) AS best, MAX(e.timestamp)
+            FROM (SELECT snapshot_id, owner_id, timestamp, SUM(total) AS value
+                  FROM effects
+                  WHERE effect_id IN ({marks}) AND kind = ? AND timestamp >= ? AND timestamp < ?
+                  GROUP BY snapshot_id, owner_id) AS e
+            GROUP BY e.owner_id
+            ORDER BY best DESC
+            LIMIT ?
+        """
+        rows = self.conn.execute(sql, (*ids, kind, start or "", end or MAX_TS, limit)).fetchall()
+        return [{"owner_id": r[0], "name": self.owner_name(kind, r[0]), "value": r[1], "last_seen": r[2]}
+                for r in rows]
+
+    def find_items(self, slot=None, rarity=None, effect=None, owner_id=None, kind=None,
+                   start=None, end=None, limit=50):
+        """Pezzi di equipaggiamento che rispettano i filtri (ultimi per timestamp)."""
+        clauses, params = ["i.timestamp >= ?", "i.timestamp < ?"], [start or "", end or MAX_TS]
+        if slot is not None:
+            clauses.append("i.slot_id = ?")
+            params.append(resolve_slot(slot))
+        if rarity is not None:
+            clauses.append("i.rarity_id = ?")
+            params.append(int(rarity))
+        if owner_id is not None:
+            clauses.append("i.owner_id = ?")
+            params.append(int(owner_id))
+        if kind is not None:
+            clauses.append("i.kind = ?")
+            params.append(kind)
+        if effect is not None:
+            ids = resolve_effect(effect)
+            clauses.append(f"EXISTS (SELECT 1 FROM effects e WHERE e.snapshot_id = i.snapshot_id "
+                           f"AND e.uid = i.uid AND e.effect_id IN ({','.join('?' * len(ids))}))")
+            params.extend(ids)
+
+        sql = f"""
+            SELECT i.timestamp, i.kind, i.owner_id, i.uid, i.slot_id, i.rarity_id, i.level, i.has_gem
+            FROM items i WHERE {' AND '.join(clauses)}
+            ORDER BY i.timestamp DESC LIMIT ?
+        """
+        rows = self.conn.execute(sql, (*params, limit)).fetchall()
+        keys = ("timestamp", "kind", "owner_id", "uid", "slot_id", "rarity_id", "level", "has_gem")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def owner_history(self, owner_id, effect, kind="commander", start=None, end=None):
+        """Andamento nel tempo del totale di un effetto per un proprietario."""
+        ids = resolve_effect(effect)
+        sql = f"""
+            SELECT timestamp, SUM(total) FROM effects
+            WHERE kind = ? AND owner_id = ? AND effect_id IN ({','.join('?' * len(ids))})
+              AND timestamp >= ? AND timestamp < ?
+            GROUP BY snapshot_id ORDER BY timestamp
+        """
+        return self.conn.execute(sql, (kind, owner_id, *ids, start or "", end or MAX_TS)).fetchall()
+
+    def owner_name(self, kind, owner_id):
+        row = self.conn.execute(
+            "SELECT name FROM owners WHERE kind = ? AND owner_id = ? ORDER BY timestamp DESC LIMIT 1",
+            (kind, owner_id)).fetchone()
+        return row[0] if row else None
+
+
+# =============================
+#   CLI
+# =============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Database storico dell'inventario")
+    parser.add_argument("--db", default=DB_PATH, help="Percorso del database SQLite")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="Carica file di cattura ricostruiti")
+    p_ingest.add_argument("files", nargs="*", help="File (default: tutti in REASSEMBLED_DIR)")
+    p_ingest.add_argument("--force", action="store_true", help="Ricarica anche i file già importati")
+
+    p_top = sub.add_parser("top", help="Proprietari con il valore più alto di un effetto")
+    p_top.add_argument("--effect", required=True, help="ID o nome dell'effetto (es. 'Forza Mischia')")
+    p_top.add_argument("--kind", default="commander", choices=["commander", "bailiff"])
+    p_top.add_argument("--since", help="Timestamp ISO iniziale (incluso)")
+    p_top.add_argument("--until", help="Timestamp ISO finale (escluso)")
+    p_top.add_argument("--limit", type=int, default=10)
+
+    p_items = sub.add_parser("items", help="Cerca pezzi di equipaggiamento")
+    p_items.add_argument("--slot", help="ID o nome dello slot")
+    p_items.add_argument("--rarity", type=int)
+    p_items.add_argument("--effect")
+    p_items.add_argument("--owner", type=int)
+    p_items.add_argument("--since")
+    p_items.add_argument("--until")
+    p_items.add_argument("--limit", type=int, default=50)
+
+    p_hist = sub.add_parser("history", help="Andamento di un effetto per un proprietario")
+    p_hist.add_argument("owner", type=int)
+    p_hist.add_argument("--effect", required=True)
+    p_hist.add_argument("--kind", default="commander", choices=["commander", "bailiff"])
+
+    args = parser.parse_args(argv)
+
+    with InventoryDB(args.db) as db:
+        if args.cmd == "ingest":
+            decode_json.VERBOSE = False
+            paths = args.files or list_capture_files(decode_json.REASSEMBLED_DIR)
+            for path in paths:
+                count = db.ingest_file(path, force=args.force)
+                print(f"📥 {path}: {count} snapshot")
+
+        elif args.cmd == "top":
+            names = ", ".join(effect_name(i) for i in resolve_effect(args.effect))
+            print(f"🏆 Classifica '{names}':")
+            for pos, row in enumerate(db.top_owners(args.effect, args.since, args.until,
+                                                    args.kind, args.limit), start=1):
+                label = row["name"] or f"{args.kind} {row['owner_id']}"
+                print(f"   {pos:>2}. {label} [ID: {row['owner_id']}] -> {row['value']:g} (ultimo: {row['last_seen']})")
+
+        elif args.cmd == "items":
+            for row in db.find_items(args.slot, args.rarity, args.effect, args.owner,
+                                     start=args.since, end=args.until, limit=args.limit):
+                gem_icon = "💎" if row["has_gem"] else ""
+                print(f"   {row['timestamp']} {row['kind']} {row['owner_id']}: UID {row['uid']} "
+                      f"{slot_name(row['slot_id'])} ({rarity_name(row['rarity_id'])}) Liv. {row['level']} {gem_icon}")
+
+        elif args.cmd == "history":
+            for ts, value in db.owner_history(args.owner, args.effect, args.kind):
+                print(f"   {ts}  {value:g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+from decode_json import slot_name
+
+# =============================
+#   STATO INVENTARIO INCREMENTALE
+# =============================
+
+OWNER_KINDS = {"commanders": "commander", "bailiffs": "bailiff"}
+OWNER_FIELDS = ("name", "general_level", "has_general")
+
+
+class InventoryState:
+    """
+    Inventario persistente in memoria: proprietario (comandante/castellano per ID)
+    -> {UID oggetto: EquipmentItem}. Ogni messaggio decodificato viene applicato
+    come aggiornamento e apply() ritorna solo le differenze:
+
+    - added:    oggetto nuovo
+    - removed:  oggetto sparito dall'inventario
+    - moved:    stesso UID passato a un altro proprietario o a un altro slot
+                (con changes se nel frattempo è anche cambiato)
+    - upgraded: stesso UID con rarità/livello/gemma/effetti cambiati
+    - owner:    campi del comandante cambiati (nome, livello generale, ...)
+
+    I proprietari assenti dal messaggio restano invariati (aggiornamento parziale).
+    """
+
+    def __init__(self):
+        self.owners = {}        # (tipo, ID) -> {campo: valore}
+        self.items = {}         # (tipo, ID) -> {uid: EquipmentItem}
+        self.item_owner = {}    # uid -> (tipo, ID)
+
+    def apply(self, decoded, timestamp=None):
+        deltas = []
+        if not decoded:
+            return deltas
+
+        incoming = {}
+        for group, kind in OWNER_KINDS.items():
+            for owner in decoded.get(group, []):
+                key = (kind, owner.get("id"))
+                incoming[key] = owner
+
+        # UID presenti nel messaggio, per distinguere "spostato" da "rimosso"
+        seen = {}
+        for key, owner in incoming.items():
+            for item in owner.get("equipment", []):
+                seen[item.uid] = key
+
+        # Versioni precedenti degli oggetti, prese prima di applicare il messaggio:
+        # il vecchio proprietario può essere già stato aggiornato quando arriva il nuovo
+        before = {}
+        for uid in seen:
+            prev_owner = self.item_owner.get(uid)
+            if prev_owner is not None:
+                before[uid] = self.items.get(prev_owner, {}).get(uid)
+
+        for key, owner in incoming.items():
+            deltas.extend(self._apply_owner(key, owner, seen, before))
+
+        if timestamp is not None:
+            for delta in deltas:
+                delta["timestamp"] = timestamp
+        return deltas
+
+    def _apply_owner(self, key, owner, seen, before):
+        deltas = []
+        owner_label = f"{key[0]}:{key[1]}"
+
+        fields = {f: owner[f] for f in OWNER_FIELDS if f in owner}
+        previous_fields = self.owners.get(key)
+        if previous_fields is not None and previous_fields != fields:
+            changes = {f: [previous_fields.get(f), v] for f, v in fields.items() if previous_fields.get(f) != v}
+            deltas.append({"type": "owner", "owner": owner_label, "changes": changes})
+        self.owners[key] = fields
+
+        old_items = self.items.get(key, {})
+        new_items = {}
+        for item in owner.get("equipment", []):
+            new_items[item.uid] = item
+
+            prev_owner = self.item_owner.get(item.uid)
+            if prev_owner is None:
+                deltas.append({"type": "added", "owner": owner_label, "uid": item.uid, "item": item})
+                continue
+
+            previous = before.get(item.uid)
+            if prev_owner != key or (previous is not None and previous.slot_id != item.slot_id):
+                delta = {"type": "moved", "owner": owner_label, "uid": item.uid, "item": item,
+                         "from_owner": f"{prev_owner[0]}:{prev_owner[1]}",
+                         "from_slot": previous.slot_id if previous is not None else None}
+                if previous is not None and previous != item:
+                    delta["changes"] = item_changes(previous, item) # Spostato e migliorato insieme
+                deltas.append(delta)
+                if prev_owner != key:
+                    self.items.get(prev_owner, {}).pop(item.uid, None)
+            elif previous is not None and previous != item:
+                deltas.append({"type": "upgraded", "owner": owner_label, "uid": item.uid, "item": item,
+                               "changes": item_changes(previous, item)})
+
+        for uid, item in old_items.items():
+            if uid not in new_items and seen.get(uid) is None:
+                deltas.append({"type": "removed", "owner": owner_label, "uid": uid, "item": item})
+                self.item_owner.pop(uid, None)
+
+        self.items[key] = new_items
+        for uid in new_items:
+            self.item_owner[uid] = key
+        return deltas
+
+    def snapshot(self):
+        """Stato completo attuale (stessa forma di process_game_data)."""
+        result = {"commanders": [], "bailiffs": []}
+        for group, kind in OWNER_KINDS.items():
+            for key, fields in self.owners.items():
+                if key[0] == kind:
+                    owner = {"id": key[1], **fields, "equipment": list(self.items.get(key, {}).values())}
+                    result[group].append(owner)
+        return result
+
+
+def item_changes(old, new):
+    """Campi cambiati tra due versioni dello stesso oggetto."""
+    changes = {}
+    for field in ("rarity_id", "level", "has_gem"):
+        if getattr(old, field) != getattr(new, field):
+            changes[field] = [getattr(old, field), getattr(new, field)]
+    if old.effects != new.effects:
+        changes["effects"] = [[e.effect_id, e.total] for e in new.effects]
+    return changes
+
+
+DELTA_ICONS = {"added": "➕", "removed": "➖", "moved": "🔀", "upgraded": "⬆️", "owner": "👑"}
+
+
+def format_delta(delta):
+    """Riga leggibile per la console."""
+    icon = DELTA_ICONS.get(delta["type"], "•")
+    item = delta.get("item")
+    if item is None:
+        return f"{icon} {delta['owner']}: {delta.get('changes')}"
+
+    desc = f"{item.slot_name} ({item.rarity_name}) UID {delta['uid']}"
+    if delta["type"] == "moved":
+        origin = delta["from_owner"]
+        if delta.get("from_slot") not in (None, item.slot_id):
+            origin += f" / {slot_name(delta['from_slot'])}"
+        changes = f" {delta['changes']}" if delta.get("changes") else ""
+        return f"{icon} {delta['owner']}: {desc} (da {origin}){changes}"
+    if delta["type"] == "upgraded":
+        return f"{icon} {delta['owner']}: {desc} {delta['changes']}"
+    return f"{icon} {delta['owner']}: {desc}"
@@ -0,0 +1,224 @@
+import argparse
+import itertools
+
+import numpy as np
+
+import decode_json
+from decode_json import EFFECT_MAP, effect_name, slot_name, iter_decoded
+from inventory_db import resolve_effect
+from inventory_state import InventoryState
+
+try:
+    # Assegnazione ottima (algoritmo ungherese); senza scipy si usa il greedy
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# =============================
+#   MATRICE EFFETTI
+# =============================
+
+COMBO_CHUNK = 65536     # Combinazioni valutate per blocco (limita la memoria)
+
+
+class LoadoutMatrix:
+    """
+    Tutti gli oggetti del roster come matrice numerica: items[i] è la coppia
+    (oggetto, indice del proprietario in owners) e
+    values[i, j] = valore totale dell'effetto effect_ids[j] sull'oggetto i.
+    Le colonne seguono gli ID di EFFECT_MAP (più eventuali ID sconosciuti).
+    """
+
+    def __init__(self, items, owners):
+        self.items = items                      # Lista di (EquipmentItem, indice in owners)
+        self.owners = owners                    # Lista di (tipo, ID, nome)
+
+        ids = set(EFFECT_MAP)
+        for item, _ in items:
+            ids.update(eff.effect_id for eff in item.effects)
+        self.effect_ids = np.array(sorted(ids), dtype=np.int64)
+        self.column = {eff_id: j for j, eff_id in enumerate(self.effect_ids.tolist())}
+
+        self.values = np.zeros((len(items), len(self.effect_ids)), dtype=np.float32)
+        self.slot = np.zeros(len(items), dtype=np.int32)
+        self.owner = np.zeros(len(items), dtype=np.int32)
+        for i, (item, owner_idx) in enumerate(items):
+            self.slot[i] = item.slot_id
+            self.owner[i] = owner_idx
+            for eff in item.effects:
+                self.values[i, self.column[eff.effect_id]] += eff.total
+
+    @classmethod
+    def from_decoded(cls, decoded):
+        """Da un risultato di process_game_data (o InventoryState.snapshot())."""
+        items, owners = [], []
+        for group, kind in (("commanders", "commander"), ("bailiffs", "bailiff")):
+            for owner in decoded.get(group, []):
+                owners.append((kind, owner.get("id"), owner.get("name")))
+                for item in owner.get("equipment", []):
+                    items.append((item, len(owners) - 1))
+        return cls(items, owners)
+
+    def vector(self, weights):
+        """{ID o nome effetto: peso} -> vettore allineato alle colonne."""
+        vec = np.zeros(len(self.effect_ids), dtype=np.float32)
+        for key, weight in weights.items():
+            for eff_id in resolve_effect(key):
+                if eff_id in self.column:
+                    vec[self.column[eff_id]] = weight
+        return vec
+
+    def caps_vector(self, caps):
+        """Tetti massimi per effetto (inf dove non specificato)."""
+        vec = np.full(len(self.effect_ids), np.inf, dtype=np.float32)
+        for key, cap in (caps or {}).items():
+            for eff_id in resolve_effect(key):
+                if eff_id in self.column:
+                    vec[self.column[eff_id]] = cap
+        return vec
+
+    # --- Punteggi ---
+
+    def owner_totals(self):
+        """Matrice proprietari x effetti: somma degli effetti equipaggiati."""
+        totals = np.zeros((len(self.owners), len(self.effect_ids)), dtype=np.float32)
+        np.add.at(totals, self.owner, self.values)
+        return totals
+
+    def score_owners(self, weights, caps=None):
+        """Punteggio pesato di ogni proprietario, in ordine decrescente."""
+        totals = np.minimum(self.owner_totals(), self.caps_vector(caps))
+        scores = totals @ self.vector(weights)
+        order = np.argsort(-scores, kind="stable")
+        return [(self.owners[i], float(scores[i])) for i in order]
+
+    def score_combos(self, combos, weights, caps=None):
+        """
+        Valuta in blocco molte combinazioni (array n_combo x n_slot di indici oggetto):
+        somma effetti, applica i tetti, prodotto con i pesi.
+        """
+        w = self.vector(weights)
+        cap = self.caps_vector(caps)
+        scores = np.empty(len(combos), dtype=np.float32)
+        for start in range(0, len(combos), COMBO_CHUNK):
+            block = combos[start:start + COMBO_CHUNK]
+            totals = self.values[block].sum(axis=1)
+            scores[start:start + len(block)] = np.minimum(totals, cap) @ w
+        return scores
+
+    # --- Ottimizzazione ---
+
+    def best_loadout(self, weights, caps=None, top_k=4, owner=None):
+        """
+        Miglior oggetto per ogni slot. Senza tetti il punteggio è additivo e basta
+        l'argmax per slot; con i tetti si valutano tutte le combinazioni dei top_k
+        oggetti di ogni slot. owner limita la ricerca agli oggetti di un proprietario.
+        """
+        w = self.vector(weights)
+        item_scores = self.values @ w
+        mask = np.ones(len(self.items), dtype=bool) if owner is None else self.owner == owner
+
+        candidates = []
+        for slot_id in np.unique(self.slot[mask]):
+            idx = np.flatnonzero(mask & (self.slot == slot_id))
+            best = idx[np.argsort(-item_scores[idx], kind="stable")[:top_k if caps else 1]]
+            candidates.append(best)
+        if not candidates:
+            return [], 0.0
+
+        combos = np.array(list(itertools.product(*candidates)), dtype=np.int64)
+        scores = self.score_combos(combos, weights, caps)
+        best = int(np.argmax(scores))
+        return [self.items[i][0] for i in combos[best]], float(scores[best])
+
+    def assign_roster(self, objectives, caps=None):
+        """
+        Distribuisce gli oggetti di tutto il roster tra i proprietari, uno per slot,
+        ognuno con i propri pesi (objectives: {indice proprietario: pesi}).
+        Ogni oggetto viene usato una sola volta. Ritorna {indice: [EquipmentItem]}.
+        """
+        owners = list(objectives)
+        weight_matrix = np.stack([self.vector(objectives[o]) for o in owners])
+        # Punteggio di ogni oggetto per ogni proprietario (n_oggetti x n_proprietari)
+        scores = np.minimum(self.values, self.caps_vector(caps)) @ weight_matrix.T
+
+        result = {o: [] for o in owners}
+        for slot_id in np.unique(self.slot):
+            idx = np.flatnonzero(self.slot == slot_id)
+            rows, cols = _assign(scores[idx])
+            for r, c in zip(rows, cols):
+                result[owners[c]].append(self.items[idx[r]][0])
+        return result
+
+
+def _assign(score):
+    """Assegnazione oggetti -> proprietari che massimizza la somma dei punteggi."""
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(score, maximize=True)
+
+    # Greedy: a ogni passo la coppia migliore rimasta
+    score = score.astype(np.float64, copy=True)
+    rows, cols = [], []
+    for _ in range(min(score.shape)):
+        r, c = np.unravel_index(np.argmax(score), score.shape)
+        if score[r, c] == -np.inf:
+            break
+        rows.append(r)
+        cols.append(c)
+        score[r, :] = -np.inf
+        score[:, c] = -np.inf
+    return rows, cols
+
+
+def parse_weights(text):
+    """"Forza Mischia=1,10004=0.5" -> {"Forza Mischia": 1.0, "10004": 0.5}."""
+    weights = {}
+    for part in filter(None, (p.strip() for p in (text or "").split(","))):
+        key, _, value = part.partition("=")
+        weights[key.strip()] = float(value or 1)
+    return weights
+
+
+# =============================
+#   CLI
+# =============================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Punteggio e ottimizzazione degli equipaggiamenti")
+    parser.add_argument("files", nargs="+", help="File di cattura ricostruiti")
+    parser.add_argument("--weights", required=True, help="Pesi, es. 'Forza Mischia=1,Forza Gittata=0.5'")
+    parser.add_argument("--caps", help="Tetti per effetto, es. 'Forza Mischia=100'")
+    parser.add_argument("--top", type=int, default=10, help="Quanti proprietari mostrare")
+    parser.add_argument("--optimize", action="store_true", help="Cerca il miglior oggetto per ogni slot")
+    args = parser.parse_args(argv)
+    weights, caps = parse_weights(args.weights), parse_weights(args.caps) or None
+    try:
+        for key in list(weights) + list(caps or ()):
+            resolve_effect(key)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Stato finale del roster dopo tutti i messaggi dei file
+    decode_json.VERBOSE = False
+    state = InventoryState()
+    for path in args.files:
+        for res in iter_decoded(path):
+            state.apply(res)
+
+    matrix = LoadoutMatrix.from_decoded(state.snapshot())
+    print(f"📐 {len(matrix.items)} oggetti, {len(matrix.owners)} proprietari, {len(matrix.effect_ids)} effetti")
+
+    print("\n🏆 Classifica:")
+    for pos, ((kind, owner_id, name), score) in enumerate(matrix.score_owners(weights, caps)[:args.top], start=1):
+        print(f"   {pos:>2}. {name or kind} [ID: {owner_id}] -> {score:g}")
+
+    if args.optimize:
+        items, score = matrix.best_loadout(weights, caps)
+        print(f"\n🛠️  Miglior equipaggiamento possibile (punteggio {score:g}):")
+        for item in items:
+            effects = ", ".join(f"{effect_name(e.effect_id)} {e.total:g}" for e in item.effects)
+            print(f"   🔸 {slot_name(item.slot_id):<10} UID {item.uid} -> {effects}")
+
+
+if __name__ == "__main__":
+    main()
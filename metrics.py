@@ -0,0 +1,218 @@
+import bisect
+import logging
+import os
+import threading
+import time
+
+# =============================
+#   METRICHE DEL PERCORSO CALDO
+# =============================
+
+# Bucket esponenziali: tempi da 1µs a ~8s, dimensioni da 64 byte a ~128 MB
+TIME_BUCKETS = tuple(1e-6 * 2 ** i for i in range(24))
+SIZE_BUCKETS = tuple(64 * 2 ** i for i in range(22))
+
+
+class Counter:
+    """
+    Contatore monotono. Lo aggiornano più thread (worker, sniffer, writer) e
+    `value += n` non è atomico nemmeno sotto GIL: l'incremento è sotto lock.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class Gauge:
+    """Ultimo valore impostato (es. scarti del kernel letti dal socket)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Istogramma a bucket fissi: observe() costa una bisect e tre somme (sotto lock, come Counter)."""
+
+    def __init__(self, name, bounds=TIME_BUCKETS):
+        self.name = name
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        bucket = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def merge(self, counts, count, total, maximum):
+        """Somma le osservazioni di un altro istogramma con gli stessi bucket."""
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+            self.count += count
+            self.total += total
+            if maximum > self.max:
+                self.max = maximum
+
+    def reset(self):
+        """Azzera e ritorna (counts, count, total, max) accumulati finora."""
+        with self._lock:
+            values = (self.counts, self.count, self.total, self.max)
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+        return values
+
+    def percentile(self, q):
+        """Limite superiore del bucket che contiene il quantile q (0-1)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class Registry:
+    """Tutte le metriche del processo, per nome."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.monotonic()
+        self._last_time = self.started
+        self._last_values = {}
+
+    def _get(self, cls, name, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args)
+        return metric
+
+    def counter(self, name):
+        return self._get(Counter, name)
+
+    def gauge(self, name):
+        return self._get(Gauge, name)
+
+    def histogram(self, name, bounds=TIME_BUCKETS):
+        return self._get(Histogram, name, bounds)
+
+    def drain(self):
+        """
+        Contatori e istogrammi accumulati dall'ultima chiamata, azzerati: un
+        processo worker li manda al principale, che li somma con merge().
+        """
+        drained = {}
+        for name, metric in list(self.metrics.items()):
+            if isinstance(metric, Counter):
+                with metric._lock:
+                    value, metric.value = metric.value, 0
+                if value:
+                    drained[name] = value
+            elif isinstance(metric, Histogram) and metric.count:
+                drained[name] = (metric.bounds,) + metric.reset()
+        return drained
+
+    def merge(self, drained):
+        """Somma i valori di drain() di un altro processo."""
+        for name, value in drained.items():
+            if isinstance(value, tuple):
+                self.histogram(name, value[0]).merge(*value[1:])
+            else:
+                self.counter(name).inc(value)
+
+    def snapshot(self):
+        """Valori attuali; per i contatori anche la media al secondo dall'avvio."""
+        uptime = time.monotonic() - self.started
+        result = {"uptime_seconds": round(uptime, 3)}
+        for name, metric in sorted(self.metrics.items()):
+            if isinstance(metric, Histogram):
+                result[name] = metric.snapshot()
+            elif isinstance(metric, Counter):
+                result[name] = metric.value
+                result[f"{name}_per_sec"] = metric.value / uptime if uptime else 0.0
+            else:
+                result[name] = metric.value
+        return result
+
+    def rates(self):
+        """Incremento al secondo di ogni contatore dall'ultima chiamata."""
+        now = time.monotonic()
+        elapsed = now - self._last_time or 1e-9
+        rates = {}
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Counter):
+                rates[name] = (metric.value - self._last_values.get(name, 0)) / elapsed
+                self._last_values[name] = metric.value
+        self._last_time = now
+        return rates
+
+
+METRICS = Registry()
+
+
+def summary_line(registry=METRICS):
+    """Riga periodica per la console: ritmi dall'ultima riga e latenze di parsing."""
+    rates = registry.rates()
+    m = registry.metrics
+    parse = m["parse_seconds"].snapshot() if "parse_seconds" in m else None
+    buffer = m["buffer_bytes"].max if "buffer_bytes" in m else 0
+
+    parts = [
+        f"{rates.get('packets', 0):.0f} pkt/s",
+        f"{rates.get('bytes', 0) / (1024 * 1024):.2f} MB/s",
+        f"{rates.get('messages', 0):.1f} msg/s",
+        f"buffer max {buffer / 1024:.0f} KB",
+    ]
+    if parse and parse["count"]:
+        parts.append(f"parse p50 {parse['p50'] * 1000:.2f}ms p99 {parse['p99'] * 1000:.2f}ms")
+    parts.append(f"JSON errati {m['json_failures'].value if 'json_failures' in m else 0}")
+    parts.append(f"resync {m['resyncs'].value if 'resyncs' in m else 0}")
+    if "cache_parsed_hits" in m and m["cache_parsed_hits"].value:
+        parts.append(f"payload ripetuti {m['cache_parsed_hits'].value}")
+    if "discarded_bytes" in m and m["discarded_bytes"].value:
+        parts.append(f"byte scartati {m['discarded_bytes'].value}")
+    if "kernel_drops" in m:
+        parts.append(f"scarti kernel {m['kernel_drops'].value}")
+    return " | ".join(parts)
+
+
+# =============================
+#   LOG
+# =============================
+
+# Le righe per pacchetto/frammento sono DEBUG: spente di default (LOG_LEVEL=DEBUG per vederle)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+def setup_logging(level=None):
+    logging.basicConfig(level=level or LOG_LEVEL, format="%(message)s")
@@ -1,8 +1,107 @@
+import base64
+import heapq
 import json
+import logging
+import re
 import sys
+import time
+
+from metrics import METRICS, SIZE_BUCKETS
+from payload_cache import PayloadCache, digest, MIN_SIZE
+
+log = logging.getLogger(__name__)
+
+# Metriche del percorso caldo (oggetti presi una volta sola, aggiornati per frammento)
+PARSE_TIME = METRICS.histogram("parse_seconds")
+BUFFER_SIZE = METRICS.histogram("buffer_bytes", SIZE_BUCKETS)
+MESSAGES = METRICS.counter("messages")
+JSON_FAILURES = METRICS.counter("json_failures")
+RESYNCS = METRICS.counter("resyncs")
+DUPLICATE_SEGMENTS = METRICS.counter("duplicate_segments")
+OUT_OF_ORDER = METRICS.counter("out_of_order_segments")
+GAP_SKIPS = METRICS.counter("gap_skips")
+DISCARDED_BYTES = METRICS.counter("discarded_bytes")
+BUFFER_OVERFLOWS = METRICS.counter("buffer_overflows")
+TRUNCATED = METRICS.counter("truncated_messages")
+
+# Caratteri rilevanti per lo scanner (il resto viene saltato in C da re)
+# Lo scanner lavora sui byte: '{', '}', '"' e '\' sono ASCII e non compaiono mai
+# dentro una sequenza UTF-8 multi-byte, quindi il taglio tra segmenti è sicuro.
+_OBJECT_TOKENS = re.compile(rb'[{}"]')
+_STRING_TOKENS = re.compile(rb'["\\]')
+_TOKEN_PATTERNS = {None: (_OBJECT_TOKENS, _STRING_TOKENS)}
+
+
+def _token_patterns(delimiter):
+    """
+    Pattern dello scanner con il delimitatore di framing come confine rigido:
+    fuori dalle stringhe se non contiene spazi (ammessi tra i token JSON),
+    dentro le stringhe se contiene un carattere di controllo (vietato non escapato).
+    """
+    patterns = _TOKEN_PATTERNS.get(delimiter)
+    if patterns is None:
+        quoted = re.escape(delimiter)
+        objects = _OBJECT_TOKENS if any(b in b" \t\r\n" for b in delimiter) else re.compile(rb'[{}"]|' + quoted)
+        strings = re.compile(rb'["\\]|' + quoted) if any(b < 0x20 for b in delimiter) else _STRING_TOKENS
+        patterns = _TOKEN_PATTERNS[delimiter] = (objects, strings)
+    return patterns
+
+
+# Testo tra un JSON e l'altro: nel formato SmartFox "%xt%<comando>%1%0%{...}%"
+# contiene l'identificativo del comando, usato per smistare i messaggi senza parsing
+_COMMAND_PATTERN = re.compile(rb'%xt%([A-Za-z0-9_]+)%')
+# Richieste del client: "%xt%<zona>%<comando>%<id>%{...}%" (il comando è il secondo campo)
+_CLIENT_COMMAND_PATTERN = re.compile(rb'%xt%[^%]+%([A-Za-z0-9_]+)%')
+PREAMBLE_MAX = 128
+
+# Limite rigido del JSON in costruzione: oltre, il messaggio viene scartato
+MAX_BUFFER = 32 * 1024 * 1024
+
+# JSON già analizzati, per impronta dei byte: un payload ripetuto salta json.loads
+PARSED_CACHE = PayloadCache("parsed")
+
+
+class FramingLearner:
+    """
+    Delimitatore di messaggio usato per il resync: configurato a mano oppure
+    imparato dal testo che precede i JSON validi. Dopo `samples` messaggi si
+    adotta il primo candidato presente in almeno `ratio` dei preamboli.
+    Condiviso tra i flussi: il protocollo è lo stesso per tutte le connessioni.
+    """
+
+    CANDIDATES = (b"%xt%", b"\x00", b"\n")
+
+    def __init__(self, delimiter=None, samples=20, ratio=0.9):
+        self.delimiter = delimiter
+        self.samples = samples
+        self.ratio = ratio
+        self.seen = 0
+        self.counts = dict.fromkeys(self.CANDIDATES, 0)
+
+    def configure(self, delimiter):
+        """Delimitatore esplicito (es. da FRAMING_DELIMITER); None riattiva l'apprendimento."""
+        self.__init__(delimiter, self.samples, self.ratio)
+
+    def observe(self, preamble):
+        if self.delimiter is not None:
+            return
+        self.seen += 1
+        for candidate in self.CANDIDATES:
+            if candidate in preamble:
+                self.counts[candidate] += 1
+        if self.seen >= self.samples:
+            for candidate in self.CANDIDATES:
+                if self.counts[candidate] >= self.ratio * self.seen:
+                    self.delimiter = candidate
+                    log.info("🔎 Delimitatore di messaggio appreso: %r", candidate)
+                    return
+
+
+FRAMING = FramingLearner()
+
 
 class CapturedPacket:
-    def __init__(self, timestamp, src, dst, sport, dport, protocol, data):
+    def __init__(self, timestamp, src, dst, sport, dport, protocol, data, seq=None):
         self.timestamp = timestamp
         self.src = src
         self.dst = dst
@@ -10,109 +109,545 @@ class CapturedPacket:
         self.dport = dport
         self.protocol = protocol
         self.data = data
+        self.seq = seq          # Numero di sequenza TCP (None per UDP / vecchi dump)
 
     def to_dict(self):
-        return {
+        record = {
             "timestamp": self.timestamp,
             "src": self.src,
             "dst": self.dst,
             "sport": self.sport,
             "dport": self.dport,
             "protocol": self.protocol,
+            "seq": self.seq,
             "data": self.data
         }
+        if isinstance(self.data, (bytes, bytearray)):
+            # Decodifica solo al momento del salvataggio, non per ogni pacchetto
+            data = bytes(self.data)
+            try:
+                record["data"] = data.decode("utf-8")
+            except UnicodeDecodeError:
+                # Carattere spezzato tra due segmenti o byte non testuali: il testo
+                # resta leggibile e i byte esatti vanno in base64 per il replay
+                record["data"] = data.decode("utf-8", errors="replace")
+                record["data_b64"] = base64.b64encode(data).decode("ascii")
+            record["size"] = len(data)
+        return record
 
 class StreamReassembler:
-    def __init__(self):
-        self.buffer = ""
+    """
+    Ricostruisce i JSON dallo stream TCP con uno scanner incrementale:
+    lo stato (profondità graffe, dentro stringa, escape) viene conservato
+    tra una chiamata e l'altra, quindi ogni frammento viene letto una sola volta.
+
+    Il buffer contiene byte grezzi: i caratteri UTF-8 spezzati tra due
+    segmenti restano integri e ogni messaggio viene decodificato una volta sola.
+
+    Il consumer opzionale riceve la lista dei messaggi completati da ogni
+    frammento (un burst di messaggi coalizzati arriva tutto insieme).
+
+    Dopo un errore (JSON non valido, buffer oltre max_buffer, buco TCP) lo
+    scanner entra in ricerca: scarta i byte fino al prossimo delimitatore di
+    framing e riparte da lì, senza riscansionare il blocco byte per byte.
+    Noto il delimitatore, trovarlo dentro un oggetto ancora aperto vuol dire
+    che il messaggio era troncato: si riparte subito da lì.
+
+    I messaggi grandi (>= MIN_SIZE) portano l'impronta dei byte in "digest":
+    un payload identico a uno recente riusa l'oggetto di PARSED_CACHE.
+    """
+
+    def __init__(self, consumer=None, max_buffer=None, framing=None, client=False):
+        self.consumer = consumer
+        self.command_pattern = _CLIENT_COMMAND_PATTERN if client else _COMMAND_PATTERN
+        self.max_buffer = max_buffer or MAX_BUFFER
+        self.framing = framing or FRAMING
+        self.hunting = False     # In cerca del prossimo delimitatore dopo un errore
+        self.buffer = bytearray() # Byte del JSON in costruzione (dal primo '{')
         self.last_timestamp = ""
+        self.fragment_timestamp = ""
         self.json_objects = []
+        self.preamble = b""      # Ultimi byte prima del '{' (per il comando)
+        self.message_preamble = b""
+        self.command = None
 
-    def add_fragment(self, data_str, timestamp):
-        # DEBUG: Stampa cosa sta arrivando (repr mostra caratteri invisibili come \n o \x00)
-        print(f"📥 [DEBUG] Fragment ricevuto: {repr(data_str[:50])}... (Len: {len(data_str)})")
-        
-        if not self.buffer:
-            self.last_timestamp = timestamp
-        
-        self.buffer += data_str
-        
-        # DEBUG: Stato del buffer attuale
-        # print(f"   [DEBUG] Buffer totale attuale: {len(self.buffer)} chars")
-
-        return self.process_buffer()
-
-    def process_buffer(self):
+        # Stato dello scanner
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def add_fragment(self, data, timestamp):
+        # DEBUG: cosa sta arrivando (repr mostra caratteri invisibili come \n o \x00)
+        log.debug("📥 [DEBUG] Fragment ricevuto: %r... (Len: %d)", data[:50], len(data))
+
+        if isinstance(data, str):
+            data = data.encode()
+        self.fragment_timestamp = timestamp
+
+        return self.process_buffer(data)
+
+    def process_buffer(self, data):
         """
-        Tenta di estrarre TUTTI i JSON validi presenti nel buffer usando 
-        il conteggio delle parentesi (Brace Counting).
+        Estrae TUTTI i JSON completati dal nuovo frammento usando
+        il conteggio delle parentesi (Brace Counting), ignorando le graffe
+        dentro le stringhe JSON. Ritorna la lista (anche vuota) dei messaggi,
+        ognuno con il timestamp del frammento in cui è iniziato.
         """
+        results = self._scan(data)
+
+        BUFFER_SIZE.observe(len(self.buffer))
+        if self.depth:
+            log.debug("⏳ [DEBUG] JSON incompleto (Graffe aperte: %d). Attendo next packet.", self.depth)
+
+        if results and self.consumer:
+            self.consumer(results)
+        return results
+
+    def _scan(self, chunk, pos=0):
+        """Scansiona solo i byte nuovi (da pos), riprendendo dallo stato salvato."""
         results = []
-        
-        while True:
-            # 1. Cerchiamo l'inizio di un potenziale JSON
-            start_index = self.buffer.find('{')
-            
-            if start_index == -1:
-                # Nessuna graffa aperta.
-                # Se il buffer è enorme e senza graffe, puliamo per evitare memory leak
-                if len(self.buffer) > 500000:
-                    print("⚠️ [DEBUG] Buffer enorme senza JSON, svuoto.")
-                    self.buffer = ""
-                break # Usciamo dal loop, servono nuovi pacchetti
-            
-            # 2. Algoritmo Conteggio Parentesi
-            brace_count = 0
-            end_index = -1
-            
-            # Scansioniamo dal punto della prima graffa in poi
-            for i, char in enumerate(self.buffer[start_index:], start=start_index):
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                
-                # Se il conteggio torna a zero, abbiamo trovato la chiusura dell'oggetto
-                if brace_count == 0:
-                    end_index = i + 1 # +1 per includere la graffa di chiusura
+        view = memoryview(chunk)
+        start = pos
+        length = len(chunk)
+        delimiter = self.framing.delimiter
+        object_tokens, string_tokens = _token_patterns(delimiter)
+        if self.depth and not self.in_string and object_tokens is not _OBJECT_TOKENS and len(delimiter) > 1:
+            # Delimitatore a cavallo tra il JSON aperto e questo frammento
+            carry = bytes(self.buffer[-(len(delimiter) - 1):])
+            found = (carry + chunk[pos:pos + len(delimiter) - 1]).find(delimiter)
+            if found != -1:
+                self._truncated(0, 0)
+                self.preamble = carry[found:] # _find_boundary riparte da qui
+
+        while pos < length:
+            # 0. Dopo un errore: saltiamo direttamente al prossimo delimitatore
+            if self.hunting and self.depth == 0:
+                found = self._find_boundary(chunk, pos)
+                if found == -1:
+                    DISCARDED_BYTES.inc(length - pos)
+                    self.preamble = (self.preamble + chunk[max(pos, length - PREAMBLE_MAX):])[-PREAMBLE_MAX:]
                     break
-            
-            # 3. Se non abbiamo trovato la fine (end_index è ancora -1), il pacchetto è incompleto
-            if end_index == -1:
-                print(f"⏳ [DEBUG] JSON incompleto (Graffe aperte: {brace_count}). Attendo next packet.")
-                break # Usciamo e aspettiamo altri dati
-            
-            # 4. Estrazione e Parsing
-            candidate_str = self.buffer[start_index:end_index]
-            
-            try:
-                json_obj = json.loads(candidate_str)
-                
-                print(f"✅ [DEBUG] JSON ESTRATTO CON SUCCESSO! (Len: {len(candidate_str)})")
-                
-                result_wrapper = {
-                    "timestamp": self.last_timestamp,
-                    "payload": json_obj
-                }
-                results.append(result_wrapper)
-                
-                # 5. Rimuoviamo il JSON estratto dal buffer e continuiamo a ciclare
-                # (perché potrebbero esserci altri JSON in coda nello stesso buffer)
-                self.buffer = self.buffer[end_index:]
-                
-                # Resettiamo il timestamp per il prossimo pezzo
-                self.last_timestamp = "" 
-
-            except json.JSONDecodeError as e:
-                print(f"❌ [DEBUG] Errore parsing su blocco identificato: {e}")
-                # Se fallisce il parsing di un blocco che sembrava bilanciato, 
-                # probabilmente non era un JSON valido (es. parte di una stringa).
-                # Avanziamo di 1 char per riprovare a cercare dalla prossima graffa
-                self.buffer = self.buffer[start_index + 1:]
-        
-        # Se abbiamo trovato qualcosa, ritorniamo l'ultimo o la lista (modifica il main per gestire liste se vuoi)
-        # Per compatibilità col tuo main attuale, ritorniamo l'ultimo trovato, 
-        # ma l'ideale sarebbe che il main gestisse una lista.
-        if results:
-            return results[-1] # Ritorna l'ultimo successo per ora
-        return None
\ No newline at end of file
+                DISCARDED_BYTES.inc(found - pos)
+                self.hunting = False
+                pos = found
+                continue
+
+            # 1. Fuori da un oggetto: cerchiamo l'inizio di un potenziale JSON
+            if self.depth == 0:
+                start = chunk.find(b'{', pos)
+                end = length if start == -1 else start
+                self.preamble = (self.preamble + chunk[max(pos, end - PREAMBLE_MAX):end])[-PREAMBLE_MAX:]
+                if start == -1:
+                    break # Tutto rumore, servono nuovi pacchetti
+                self.depth = 1
+                self.last_timestamp = self.fragment_timestamp
+                self.command = self._parse_command()
+                pos = start + 1
+                continue
+
+            # 2. Carattere successivo a un backslash (anche a cavallo di due frammenti)
+            if self.escape:
+                self.escape = False
+                pos += 1
+                continue
+
+            # 3. Dentro una stringa contano solo le virgolette e gli escape
+            if self.in_string:
+                match = string_tokens.search(chunk, pos)
+                if not match:
+                    break
+                token = match.group()
+                if token == b'"':
+                    self.in_string = False
+                elif token == b'\\':
+                    self.escape = True
+                else:
+                    self._truncated(start, match.start())
+                    pos = match.start()
+                    continue
+                pos = match.end()
+                continue
+
+            # 4. Algoritmo Conteggio Parentesi
+            match = object_tokens.search(chunk, pos)
+            if not match:
+                break
+            char = match.group()
+            if len(char) > 1 or char not in b'{}"':
+                # Delimitatore dentro un oggetto aperto: il messaggio era troncato
+                self._truncated(start, match.start())
+                pos = match.start()
+                continue
+            pos = match.end()
+
+            if char == b'"':
+                self.in_string = True
+            elif char == b'{':
+                self.depth += 1
+            else:
+                self.depth -= 1
+                # Se il conteggio torna a zero, abbiamo trovato la chiusura dell'oggetto
+                if self.depth == 0:
+                    if self.buffer:
+                        self.buffer += view[start:pos]
+                        candidate = bytes(self.buffer)
+                        self.buffer = bytearray()
+                    else:
+                        candidate = bytes(view[start:pos])
+                    results.extend(self._extract(candidate))
+                    start = pos
+
+        # Conserviamo solo la parte che appartiene al JSON ancora aperto
+        if self.depth:
+            self.buffer += view[start:]
+            if len(self.buffer) > self.max_buffer:
+                # Messaggio oltre il limite (o graffa mai chiusa): scartato in blocco
+                BUFFER_OVERFLOWS.inc()
+                log.warning("⚠️ Buffer oltre %d bytes, messaggio scartato.", self.max_buffer)
+                self.reset()
+
+        return results
+
+    def _truncated(self, start, end):
+        """Scarta il JSON aperto (buffer + chunk[start:end]) e riparte dal delimitatore."""
+        TRUNCATED.inc()
+        DISCARDED_BYTES.inc(len(self.buffer) + end - start)
+        log.debug("✂️ [DEBUG] Messaggio troncato (%d bytes), riparto dal delimitatore.", len(self.buffer) + end - start)
+        self.buffer = bytearray()
+        self.preamble = b""
+        self.resync()
+
+    def _find_boundary(self, chunk, pos):
+        """
+        Posizione da cui ripartire: l'inizio del prossimo delimitatore (il comando
+        nel preambolo resta leggibile) oppure, senza delimitatore, il prossimo '{'.
+        -1 se nel frammento non c'è.
+        """
+        delimiter = self.framing.delimiter
+        if delimiter is None:
+            self.preamble = b""
+            return chunk.find(b'{', pos)
+
+        # Delimitatore spezzato tra il frammento precedente e questo (viene prima di tutti)
+        carry = self.preamble[-(len(delimiter) - 1):] if len(delimiter) > 1 else b""
+        if carry and delimiter in carry + chunk[pos:pos + len(delimiter) - 1]:
+            return pos
+        found = chunk.find(delimiter, pos)
+        if found != -1:
+            self.preamble = b""
+            return found
+        return -1
+
+    def _parse_command(self):
+        """Ultimo identificativo di comando nel testo che precede il JSON."""
+        matches = self.command_pattern.findall(self.preamble)
+        self.message_preamble = self.preamble
+        self.preamble = b""
+        return matches[-1].decode("ascii") if matches else None
+
+    def _extract(self, candidate):
+        """Decodifica (UTF-8) ed esegue il parsing di un blocco bilanciato."""
+        t0 = time.perf_counter()
+        key = json_obj = None
+        if len(candidate) >= MIN_SIZE and PARSED_CACHE.enabled:
+            key = digest(candidate)
+            json_obj = PARSED_CACHE.get(key)
+        try:
+            if json_obj is None:
+                json_obj = json.loads(candidate)
+                if key is not None:
+                    PARSED_CACHE.put(key, json_obj, len(candidate))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            JSON_FAILURES.inc()
+            log.debug("❌ [DEBUG] Errore parsing su blocco identificato: %s", e)
+            # Un blocco bilanciato ma non valido (segmento corrotto, due messaggi
+            # fusi): ripartiamo dal prossimo delimitatore dentro al blocco, una
+            # sola scansione in C invece di un tentativo per ogni graffa.
+            self.resync()
+            if self.framing.delimiter is None:
+                # Ancora nessun delimitatore: il blocco viene scartato per intero
+                DISCARDED_BYTES.inc(len(candidate))
+                return []
+            return self._scan(candidate, 1)
+
+        PARSE_TIME.observe(time.perf_counter() - t0)
+        MESSAGES.inc()
+        self.framing.observe(self.message_preamble)
+        log.debug("✅ [DEBUG] JSON ESTRATTO CON SUCCESSO! (Len: %d)", len(candidate))
+
+        result_wrapper = {
+            "timestamp": self.last_timestamp,
+            "command": self.command,
+            "payload": json_obj
+        }
+        if key is not None:
+            # Payload condiviso con i messaggi identici: sola lettura
+            result_wrapper["digest"] = key
+        return [result_wrapper]
+
+    def resync(self):
+        """Azzera lo scanner e cerca il prossimo confine di messaggio."""
+        RESYNCS.inc()
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.hunting = True
+
+    def reset(self):
+        """Scarta il JSON parziale (es. dopo un buco nello stream TCP)."""
+        if self.buffer:
+            DISCARDED_BYTES.inc(len(self.buffer))
+        self.buffer = bytearray()
+        self.preamble = b""
+        self.resync()
+
+
+# =============================
+#   RIORDINO TCP PER FLUSSO
+# =============================
+
+SEQ_MOD = 2 ** 32
+SEQ_HALF = 2 ** 31
+
+GAP_TIMEOUT = 2.0     # Secondi di attesa di un segmento mancante prima di saltarlo
+START_SEGMENTS = 4    # Senza SYN: segmenti osservati prima di scegliere l'inizio del flusso
+START_WINDOW = 0.5    # ... oppure secondi dal primo segmento
+
+
+class TcpStream:
+    """
+    Riordina i segmenti di un singolo flusso TCP in base al numero di sequenza,
+    scartando ritrasmissioni e byte sovrapposti prima del reassembler.
+
+    L'inizio del flusso è l'ISN del SYN; se la cattura parte a metà connessione
+    si raccolgono i primi START_SEGMENTS segmenti (o START_WINDOW secondi) e si
+    parte dal più basso. Un buco che resta aperto per gap_timeout secondi, o con
+    più di max_pending byte in attesa, viene saltato.
+
+    Le posizioni interne sono numeri di sequenza "srotolati" (senza il giro a
+    2^32), così i segmenti in attesa stanno in un heap ordinato.
+    """
+
+    def __init__(self, reassembler, max_pending=4 * 1024 * 1024, gap_timeout=GAP_TIMEOUT,
+                 start_segments=START_SEGMENTS, start_window=START_WINDOW):
+        self.reassembler = reassembler
+        self.next_pos = None     # Prossimo byte atteso (provvisorio finché synced è False)
+        self.synced = False
+        self.pending = {}        # posizione -> payload (segmenti arrivati in anticipo)
+        self.heap = []           # posizioni in attesa, la più bassa in testa
+        self.pending_bytes = 0
+        self.pending_since = None
+        self.max_pending = max_pending
+        self.gap_timeout = gap_timeout
+        self.start_segments = start_segments
+        self.start_window = start_window
+        self.started = None
+        self.last_timestamp = ""
+        self.last_seen = 0.0
+
+    @property
+    def next_seq(self):
+        return None if self.next_pos is None else self.next_pos % SEQ_MOD
+
+    def _unwrap(self, seq):
+        """Numero di sequenza a 32 bit -> posizione, la più vicina al prossimo byte atteso."""
+        if self.next_pos is None:
+            return seq
+        offset = (seq - self.next_pos) % SEQ_MOD
+        return self.next_pos + offset if offset < SEQ_HALF else self.next_pos - (SEQ_MOD - offset)
+
+    def syn(self, seq):
+        """SYN / SYN-ACK visto: i dati iniziano da ISN + 1."""
+        if self.synced:
+            return []
+        self.next_pos = self._unwrap((seq + 1) % SEQ_MOD)
+        self.synced = True
+        return self._drain(self.last_timestamp)
+
+    def add_segment(self, seq, payload, timestamp):
+        now = time.monotonic()
+        self.last_timestamp = timestamp
+        if seq is None:
+            # Senza numero di sequenza (vecchi dump) si assume l'ordine di arrivo
+            if self.next_pos is None:
+                self.next_pos, self.synced = 0, True
+            pos = self.next_pos
+        else:
+            pos = self._unwrap(seq)
+        if self.next_pos is None:
+            self.next_pos = pos
+            self.started = now
+
+        if not self.synced:
+            # Cattura iniziata a metà flusso: i primi segmenti possono essere invertiti
+            self._store(pos, payload, now)
+            if len(self.pending) >= self.start_segments or now - self.started >= self.start_window:
+                return self._start(timestamp)
+            return []
+
+        payload = self._trim(pos, payload)
+        if payload is None:
+            DUPLICATE_SEGMENTS.inc()
+            return [] # Duplicato / ritrasmissione già consegnata
+
+        if pos > self.next_pos:
+            # Segmento fuori ordine: lo teniamo da parte finché non arriva il buco
+            OUT_OF_ORDER.inc()
+            self._store(pos, payload, now)
+            if self.pending_bytes > self.max_pending or now - self.pending_since >= self.gap_timeout:
+                return self._skip_gap(timestamp)
+            return []
+
+        results = self._deliver(payload, timestamp)
+        results.extend(self._drain(timestamp))
+        return results
+
+    def tick(self, now=None):
+        """Controllo periodico: avvio del flusso o buco scaduti anche senza nuovi segmenti."""
+        if not self.pending:
+            return []
+        now = time.monotonic() if now is None else now
+        if not self.synced:
+            if now - self.started >= self.start_window:
+                return self._start(self.last_timestamp)
+        elif now - self.pending_since >= self.gap_timeout:
+            return self._skip_gap(self.last_timestamp)
+        return []
+
+    def flush(self):
+        """Fine della cattura: consegna tutto ciò che è in attesa, saltando i buchi."""
+        results = []
+        while self.pending:
+            results.extend(self._skip_gap(self.last_timestamp) if self.synced else self._start(self.last_timestamp))
+        return results
+
+    def _start(self, timestamp):
+        self.next_pos = self.heap[0]
+        self.synced = True
+        return self._drain(timestamp)
+
+    def _trim(self, pos, payload):
+        """Taglia i byte già consegnati; None se il segmento è tutto duplicato."""
+        behind = self.next_pos - pos
+        if behind <= 0:
+            return payload
+        if behind >= len(payload):
+            return None
+        return payload[behind:]
+
+    def _store(self, pos, payload, now):
+        old = self.pending.get(pos)
+        if old is not None:
+            if len(old) >= len(payload):
+                return
+            self.pending_bytes -= len(old)
+        else:
+            heapq.heappush(self.heap, pos)
+        if self.pending_since is None:
+            self.pending_since = now
+        self.pending[pos] = payload
+        self.pending_bytes += len(payload)
+
+    def _deliver(self, payload, timestamp):
+        self.next_pos += len(payload)
+        return self.reassembler.add_fragment(payload, timestamp)
+
+    def _drain(self, timestamp):
+        """Consegna i segmenti in attesa diventati contigui."""
+        results = []
+        delivered = False
+        while self.heap and self.heap[0] <= self.next_pos:
+            pos = heapq.heappop(self.heap)
+            payload = self.pending.pop(pos)
+            self.pending_bytes -= len(payload)
+            payload = self._trim(pos, payload)
+            if payload is not None:
+                delivered = True
+                results.extend(self._deliver(payload, timestamp))
+        if not self.pending:
+            self.pending_since = None
+        elif delivered:
+            self.pending_since = time.monotonic() # Nuovo buco: il timeout riparte
+        return results
+
+    def _skip_gap(self, timestamp):
+        """Il buco non verrà mai colmato (pacchetto perso dalla cattura): lo saltiamo."""
+        first = self.heap[0]
+        GAP_SKIPS.inc()
+        log.warning("⚠️ Buco nello stream TCP (%d bytes), riallineo.", first - self.next_pos)
+        self.reassembler.reset()
+        self.next_pos = first
+        self.pending_since = time.monotonic()
+        return self._drain(timestamp)
+
+
+class FlowTable:
+    """Un reassembler per ogni connessione (src, sport, dst, dport)."""
+
+    def __init__(self, idle_timeout=300.0, reassembler_factory=StreamReassembler, consumer=None,
+                 tick_interval=0.25):
+        self.flows = {}
+        self.consumer = consumer
+        self.idle_timeout = idle_timeout
+        self.reassembler_factory = reassembler_factory
+        self.tick_interval = tick_interval
+        self.last_sweep = time.monotonic()
+        self.last_tick = self.last_sweep
+
+    def _flow(self, key):
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = TcpStream(self.reassembler_factory(self.consumer))
+            self.flows[key] = flow
+        flow.last_seen = time.monotonic()
+        return flow
+
+    def add_segment(self, key, seq, payload, timestamp):
+        flow = self._flow(key)
+        if flow.last_seen - self.last_sweep > self.idle_timeout:
+            self.expire(flow.last_seen)
+
+        return flow.add_segment(seq, payload, timestamp)
+
+    def syn(self, key, seq):
+        """SYN della connessione: fissa l'inizio del flusso."""
+        return self._flow(key).syn(seq)
+
+    def tick(self, now=None):
+        """
+        Buchi scaduti e flussi in attesa di partire, al più ogni tick_interval secondi:
+        [(chiave, messaggi)] dei flussi che hanno consegnato qualcosa.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.last_tick < self.tick_interval:
+            return []
+        self.last_tick = now
+        delivered = []
+        for key, flow in list(self.flows.items()):
+            messages = flow.tick(now)
+            if messages:
+                delivered.append((key, messages))
+        return delivered
+
+    def flush(self):
+        """Fine cattura: consegna i segmenti ancora in attesa di tutti i flussi."""
+        delivered = []
+        for key, flow in list(self.flows.items()):
+            messages = flow.flush()
+            if messages:
+                delivered.append((key, messages))
+        return delivered
+
+    def close(self, key):
+        """Chiusura esplicita del flusso (FIN/RST): consegna i segmenti ancora in attesa."""
+        flow = self.flows.pop(key, None)
+        return flow.flush() if flow is not None else []
+
+    def expire(self, now=None):
+        """Elimina i flussi inattivi da più di idle_timeout secondi."""
+        now = time.monotonic() if now is None else now
+        self.last_sweep = now
+        idle = [k for k, f in self.flows.items() if now - f.last_seen > self.idle_timeout]
+        for key in idle:
+            del self.flows[key]
+        return len(idle)
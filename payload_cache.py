@@ -0,0 +1,90 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import METRICS
+
+# =============================
+#   CACHE PER CONTENUTO (LRU)
+# =============================
+
+# Sotto questa soglia hash + lookup costano quanto il json.loads che si risparmia
+MIN_SIZE = 4 * 1024
+
+_MISSING = object()
+
+
+def digest(data):
+    """Impronta del contenuto: 128 bit di BLAKE2b in esadecimale (32 caratteri)."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class PayloadCache:
+    """
+    Cache LRU indicizzata dall'impronta dei byte del messaggio: il server rimanda
+    spesso payload identici (roster completi, configurazioni statiche) e così
+    vengono analizzati e decodificati una volta sola.
+
+    Limitata sia nel numero di voci sia nei byte (size dichiarata da put()).
+    Condivisa tra i worker di elaborazione: get/put sono protetti da un lock.
+    I valori sono condivisi tra tutti i messaggi con la stessa impronta:
+    chi li riceve deve trattarli in sola lettura.
+    """
+
+    def __init__(self, name, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   # impronta -> (valore, byte)
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.hits = METRICS.counter(f"cache_{name}_hits")
+        self.misses = METRICS.counter(f"cache_{name}_misses")
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses.inc()
+                return default
+            self.entries.move_to_end(key)
+            self.hits.inc()
+            return entry[0]
+
+    def put(self, key, value, size=0):
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits.value + self.misses.value
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "hit_ratio": self.hits.value / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,333 @@
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+
+from metrics import METRICS
+
+# =============================
+#   STADI PRODUTTORE / CONSUMATORE
+# =============================
+
+_STOP = object()
+
+# I worker di ShardedProcessStage partono con "spawn": niente fork di un processo
+# che ha già thread attivi (writer, sniffer, server di streaming)
+_CONTEXT = multiprocessing.get_context("spawn")
+METRICS_INTERVAL = 1.0  # Ogni quanto un processo worker manda le sue metriche al principale
+
+
+class Stage:
+    """
+    Uno stadio della pipeline: coda limitata + thread worker che chiama handler(*item).
+
+    Con block=False put() non attende mai (lo usa il thread di cattura: se la coda
+    è piena il pacchetto viene scartato e contato). Con block=True put() attende
+    fino a put_timeout secondi, propagando la contropressione allo stadio a monte.
+    """
+
+    def __init__(self, name, handler, maxsize=50000, block=False, put_timeout=1.0):
+        self.name = name
+        self.handler = handler
+        self.block = block
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+
+        # Contatori
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.busy_seconds = 0.0
+        self.latency = METRICS.histogram(f"stage_{name}_seconds")
+
+        self._thread = threading.Thread(target=self._run, name=f"stage-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, *item):
+        """Accoda un elemento (ritorna None: usabile direttamente come prn di scapy)."""
+        try:
+            if self.block:
+                self.queue.put(item, timeout=self.put_timeout)
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"⚠️ Coda '{self.name}' piena: {self.dropped} elementi scartati")
+            return
+
+        self.enqueued += 1
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def close(self):
+        """Elabora quanto è già in coda e ferma il worker."""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+    def stats(self):
+        return {
+            "stage": self.name,
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+
+            t0 = time.perf_counter()
+            try:
+                self.handler(*item)
+            except Exception as e:
+                # Un pacchetto malformato non deve fermare lo stadio
+                self.errors += 1
+                print(f"❌ Errore nello stadio '{self.name}': {e}")
+            elapsed = time.perf_counter() - t0
+            self.busy_seconds += elapsed
+            self.latency.observe(elapsed)
+            self.processed += 1
+
+
+class ShardedStage:
+    """
+    N stadi concorrenti con lo stesso handler: shard(*item) sceglie lo stadio, così
+    gli elementi con la stessa chiave (es. la stessa connessione TCP) finiscono
+    sempre allo stesso worker, nell'ordine di arrivo, e lo stato per chiave non
+    viene mai toccato da due thread.
+    """
+
+    def __init__(self, name, handler, shards, shard, maxsize=50000, block=False, put_timeout=1.0):
+        self.name = name
+        self.shard = shard
+        self.stages = [Stage(f"{name}-{i}", handler, maxsize=maxsize, block=block, put_timeout=put_timeout)
+                       for i in range(shards)]
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def put(self, *item):
+        self.stages[self.shard(*item)].put(*item)
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+
+def _process_main(name, index, setup, inbox, outbox):
+    """Corpo di un processo worker: lotti da inbox, risultati e contatori su outbox."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C lo gestisce il processo principale
+    pending = []
+    handler = setup(lambda *result: pending.append(result))
+    last_metrics = time.monotonic()
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            break
+
+        processed = errors = 0
+        t0 = time.perf_counter()
+        for item in batch:
+            try:
+                handler(*item)
+            except Exception as e:
+                errors += 1
+                print(f"❌ Errore nello stadio '{name}': {e}")
+            processed += 1
+        busy = time.perf_counter() - t0
+
+        drained = None
+        if time.monotonic() - last_metrics >= METRICS_INTERVAL:
+            drained = METRICS.drain()
+            last_metrics = time.monotonic()
+        # La Queue serializza più tardi, in un suo thread: si manda una copia
+        outbox.put((index, list(pending), processed, errors, busy, drained))
+        pending.clear()
+
+    outbox.put((index, None, 0, 0, 0.0, METRICS.drain()))
+
+
+class ProcessStage:
+    """
+    Uno stadio in un processo separato, con i contatori di Stage. Gli elementi
+    viaggiano a lotti di `batch` su una multiprocessing.Queue (maxsize è in
+    elementi, come per Stage): nel figlio setup(emit) crea l'handler e ciò che
+    viene passato a emit torna al principale tramite la outbox comune.
+    """
+
+    def __init__(self, name, index, setup, outbox, maxsize=50000, batch=256):
+        self.name = name
+        self.batch = batch
+        self.inbox = _CONTEXT.Queue(maxsize=max(maxsize // batch, 1))
+        self.buffer = []
+        self._lock = threading.Lock()
+
+        # Contatori (processed/errors/busy_seconds arrivano dal worker)
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.busy_seconds = 0.0
+
+        self.process = _CONTEXT.Process(target=_process_main, args=(name, index, setup, self.inbox, outbox),
+                                        name=f"stage-{name}", daemon=True)
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def put(self, *item):
+        with self._lock:
+            self.buffer.append(item)
+            if len(self.buffer) >= self.batch:
+                self._send()
+
+    def flush(self):
+        """Manda il lotto parziale (chiamato periodicamente: latenza limitata anche a basso traffico)."""
+        with self._lock:
+            if self.buffer:
+                self._send()
+
+    def _send(self):
+        batch, self.buffer = self.buffer, []
+        try:
+            self.inbox.put_nowait(batch)
+        except queue.Full:
+            before, self.dropped = self.dropped, self.dropped + len(batch)
+            if before == 0 or before // 1000 != self.dropped // 1000:
+                print(f"⚠️ Coda '{self.name}' piena: {self.dropped} elementi scartati")
+            return
+
+        self.enqueued += len(batch)
+        depth = self.enqueued - self.processed
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def close(self):
+        """Manda il lotto rimasto e chiede al worker di fermarsi (dopo la coda)."""
+        self.flush()
+        if self.process.is_alive():
+            self.inbox.put(None)
+
+    def stats(self):
+        return {
+            "stage": self.name,
+            "depth": self.enqueued - self.processed,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+
+class ShardedProcessStage:
+    """
+    Come ShardedStage, ma ogni shard è un processo: il lavoro per chiave si
+    distribuisce sui core invece di contendersi il GIL. setup deve essere una
+    funzione di modulo (viene importata nel figlio); on_result(*result) riceve,
+    in un thread del processo principale, ciò che i worker passano a emit.
+    Le metriche dei worker vengono sommate a quelle del principale.
+    """
+
+    def __init__(self, name, setup, shards, shard, on_result, maxsize=50000, batch=256, flush_interval=0.05):
+        self.name = name
+        self.shard = shard
+        self.on_result = on_result
+        self.flush_interval = flush_interval
+        self.outbox = _CONTEXT.Queue()
+        self.stages = [ProcessStage(f"{name}-{i}", i, setup, self.outbox, maxsize=maxsize, batch=batch)
+                       for i in range(shards)]
+        self._stopping = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"stage-{name}-flush", daemon=True)
+        self._collector = threading.Thread(target=self._collect, name=f"stage-{name}-results", daemon=True)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        self._flusher.start()
+        self._collector.start()
+        return self
+
+    def put(self, *item):
+        self.stages[self.shard(*item)].put(*item)
+
+    def _flush_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            for stage in self.stages:
+                stage.flush()
+
+    def _collect(self):
+        finished = set()
+        while len(finished) < len(self.stages):
+            try:
+                index, results, processed, errors, busy, drained = self.outbox.get(timeout=1.0)
+            except queue.Empty:
+                for i, stage in enumerate(self.stages):
+                    if i not in finished and stage.process.exitcode is not None:
+                        print(f"❌ Worker '{stage.name}' terminato (codice {stage.process.exitcode})")
+                        finished.add(i)
+                continue
+
+            if drained:
+                METRICS.merge(drained)
+            stage = self.stages[index]
+            if results is None:
+                finished.add(index)
+                continue
+            stage.processed += processed
+            stage.errors += errors
+            stage.busy_seconds += busy
+            for result in results:
+                try:
+                    self.on_result(*result)
+                except Exception as e:
+                    stage.errors += 1
+                    print(f"❌ Errore sui risultati dello stadio '{stage.name}': {e}")
+
+    def close(self):
+        """Elabora quanto è già in coda, raccoglie gli ultimi risultati e ferma i worker."""
+        self._stopping.set()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        for stage in self.stages:
+            stage.close()
+        if self._collector.is_alive():
+            self._collector.join()
+        for stage in self.stages:
+            stage.process.join()
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+
+def format_stats(stages):
+    """Riga di riepilogo: profondità attuale/massima e scarti per ogni stadio."""
+    parts = []
+    for stage in stages:
+        s = stage.stats()
+        parts.append(f"{s['stage']}: coda {s['depth']} (max {s['max_depth']}) "
+                     f"ok {s['processed']} scartati {s['dropped']}")
+    return " | ".join(parts)
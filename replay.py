@@ -0,0 +1,249 @@
+import argparse
+import base64
+import contextlib
+import os
+import sys
+import time
+from datetime import datetime
+
+from capture_writer import NullWriter, BinaryCapture, read_records
+from fast_capture import iter_pcap_frames, is_classic_pcap, parse_frame, build_packet
+from packet_logic import CapturedPacket
+from correlator import format_rtt
+from windows import parse_time
+
+# =============================
+#   LETTURA FILE DI CATTURA
+# =============================
+
+PCAP_EXTENSIONS = (".pcap", ".pcapng", ".cap")
+
+
+def iter_pcap(path):
+    """Pacchetti scapy da pcap/pcapng: (timestamp epoch, pacchetto, byte)."""
+    from scapy.utils import PcapReader # PcapReader riconosce anche il formato pcapng
+
+    with PcapReader(path) as reader:
+        for packet in reader:
+            size = len(packet.original) if getattr(packet, "original", None) else len(packet)
+            yield float(packet.time), packet, size
+
+
+def iter_pcap_fast(path):
+    """Pcap classico letto con il parser struct: (timestamp, (CapturedPacket, flags), byte)."""
+    for ts, frame, linktype in iter_pcap_frames(path):
+        parsed = parse_frame(frame, linktype)
+        if parsed is None:
+            continue
+        yield ts, build_packet(parsed, ts), len(frame)
+
+
+def iter_dump(path, start=None, end=None, flow=None):
+    """
+    CapturedPacket dai nostri dump in captured_data/raw (.gpk, .jsonl.gz, .json).
+    Nei .gpk indicizzati finestra temporale e connessione si cercano nell'indice;
+    negli altri formati start/end/flow sono applicati da select().
+    """
+    if path.endswith(".gpk"):
+        with BinaryCapture(path) as capture:
+            packets = capture.window(start, end, flow) if len(capture) else capture
+            for pkt in packets:
+                yield datetime.fromisoformat(pkt.timestamp).timestamp(), pkt, len(pkt.data)
+        return
+
+    for rec in read_records(path):
+        if "data_b64" in rec:
+            data = base64.b64decode(rec["data_b64"])
+        else:
+            data = rec.get("data", "")
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+        seq = rec.get("seq")
+        if rec.get("size") != len(data):
+            # Vecchi dump (testo con errors="ignore", senza size): i byte persi
+            # sfaserebbero i numeri di sequenza, si usa l'ordine di arrivo
+            seq = None
+        pkt = CapturedPacket(rec["timestamp"], rec["src"], rec["dst"], rec["sport"], rec["dport"],
+                             rec.get("protocol", "TCP"), data, seq)
+        yield datetime.fromisoformat(pkt.timestamp).timestamp(), pkt, len(data)
+
+
+def packet_flow(item):
+    """(src, sport, dst, dport) di un elemento delle sorgenti; None se non è TCP/UDP su IPv4."""
+    if isinstance(item, tuple):
+        item = item[0] # (CapturedPacket, flags) del parser veloce
+    if isinstance(item, CapturedPacket):
+        return item.src, item.sport, item.dst, item.dport
+    if "IP" not in item:
+        return None
+    for proto in ("TCP", "UDP"):
+        if proto in item:
+            return item["IP"].src, item[proto].sport, item["IP"].dst, item[proto].dport
+    return None
+
+
+def select(source, start=None, end=None, flow=None):
+    """Filtra una sorgente (ts, elemento, byte) per finestra [start, end) e connessione."""
+    flows = None if flow is None else {tuple(flow), (flow[2], flow[3], flow[0], flow[1])}
+    for ts, item, size in source:
+        if (start is not None and ts < start) or (end is not None and ts >= end):
+            continue
+        if flows is not None and packet_flow(item) not in flows:
+            continue
+        yield ts, item, size
+
+
+def parse_flow(text):
+    """'IP:PORTA-IP:PORTA' -> (src, sport, dst, dport)."""
+    try:
+        a, b = text.split("-")
+        (src, sport), (dst, dport) = a.rsplit(":", 1), b.rsplit(":", 1)
+        return src.strip(), int(sport), dst.strip(), int(dport)
+    except ValueError:
+        raise ValueError(f"connessione non valida: '{text}' (atteso IP:PORTA-IP:PORTA)")
+
+
+# =============================
+#   REPLAY
+# =============================
+
+def replay_files(paths, realtime=False, speed=1.0, decode=False, save=False, verbose=False, fast=False,
+                 start=None, end=None, flow=None):
+    """
+    Spinge i file nella stessa pipeline della cattura live (handle_packet /
+    process_packet) e ritorna le statistiche di throughput.
+    Con fast=True i pcap classici vengono letti senza scapy (come FastSniffer).
+    start/end (epoch) e flow (src, sport, dst, dport) limitano i pacchetti riprodotti.
+    """
+    import sniffer_main
+    from metrics import setup_logging
+
+    if verbose:
+        setup_logging("DEBUG") # Righe per pacchetto / frammento del logger
+    if save:
+        sniffer_main.start_writers()
+    else:
+        sniffer_main.RAW_WRITER = NullWriter()
+        sniffer_main.REASSEMBLED_WRITER = NullWriter()
+
+    stats = {"packets": 0, "bytes": 0, "messages": 0, "decoded": 0, "decode_seconds": 0.0}
+
+    if decode:
+        from decode_json import decode_record
+
+        store_messages = sniffer_main.store_messages
+
+        def decode_messages(messages):
+            store_messages(messages)
+            t0 = time.perf_counter()
+            for msg in messages:
+                if decode_record(msg):
+                    stats["decoded"] += 1
+            stats["decode_seconds"] += time.perf_counter() - t0
+
+        sniffer_main.store_messages = decode_messages # Letta da deliver_response
+
+    # Le stampe rimaste (salvataggio, decodifica) dominerebbero il tempo misurato
+    out = sys.stdout if verbose else open(os.devnull, "w", encoding="utf-8")
+    first_ts = None
+    started = time.perf_counter()
+
+    with contextlib.redirect_stdout(out):
+        for path in paths:
+            if path.lower().endswith(PCAP_EXTENSIONS):
+                if fast and is_classic_pcap(path):
+                    source = iter_pcap_fast(path)
+                    handler = lambda item: sniffer_main.process_packet(*item)
+                else:
+                    source, handler = iter_pcap(path), sniffer_main.handle_packet
+                source = select(source, start, end, flow)
+            elif path.endswith(".gpk"):
+                source, handler = iter_dump(path, start, end, flow), sniffer_main.process_packet
+            else:
+                source, handler = select(iter_dump(path), start, end, flow), sniffer_main.process_packet
+
+            for ts, item, size in source:
+                if realtime:
+                    # Rispetta gli intervalli originali tra i pacchetti (diviso speed)
+                    if first_ts is None:
+                        first_ts = ts
+                    delay = (ts - first_ts) / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                handler(item)
+                stats["packets"] += 1
+                stats["bytes"] += size
+
+        # Fine cattura: i segmenti rimasti in attesa di un buco non arriveranno più
+        for shard in sniffer_main.SHARDS:
+            shard.flush()
+
+    elapsed = time.perf_counter() - started
+    if out is not sys.stdout:
+        out.close()
+
+    sniffer_main.CORRELATOR.expire()
+    stats["rtt"] = sniffer_main.CORRELATOR.stats()
+    stats["parse_cache"] = sniffer_main.PARSED_CACHE.stats()
+    if save:
+        sniffer_main.save_all_data()
+    # Solo dopo save_all_data: il thread del writer ha svuotato la coda
+    stats["messages"] = sniffer_main.REASSEMBLED_WRITER.written
+
+    stats["seconds"] = elapsed
+    stats["packets_per_sec"] = stats["packets"] / elapsed if elapsed else 0.0
+    stats["mb_per_sec"] = stats["bytes"] / elapsed / (1024 * 1024) if elapsed else 0.0
+    return stats
+
+
+def print_report(stats):
+    print("\n📊 REPLAY COMPLETATO")
+    print(f"   Pacchetti:   {stats['packets']} ({stats['bytes'] / (1024 * 1024):.2f} MB) in {stats['seconds']:.2f}s")
+    print(f"   Throughput:  {stats['packets_per_sec']:.0f} pkt/s | {stats['mb_per_sec']:.2f} MB/s")
+    print(f"   JSON ricostruiti: {stats['messages']}")
+    if stats["decoded"] or stats["decode_seconds"]:
+        print(f"   Decodificati: {stats['decoded']} in {stats['decode_seconds']:.2f}s")
+    cache = stats.get("parse_cache")
+    if cache and cache["hits"]:
+        print(f"   Payload ripetuti: {cache['hits']} su {cache['hits'] + cache['misses']} (parsing saltato)")
+    if stats.get("rtt"):
+        print(f"\n⏱️  Tempi di risposta per comando:\n{format_rtt(stats['rtt'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay offline di catture pcap/pcapng o dump raw")
+    parser.add_argument("files", nargs="+", help="File .pcap/.pcapng o dump di captured_data/raw")
+    parser.add_argument("--target", help="Server di gioco, IP[:PORTA] separati da virgole (default: TARGETS / TARGET_IP dal .env)")
+    parser.add_argument("--realtime", action="store_true", help="Rispetta i tempi originali di cattura")
+    parser.add_argument("--speed", type=float, default=1.0, help="Moltiplicatore di velocità per --realtime")
+    parser.add_argument("--decode", action="store_true", help="Esegue anche process_game_data sui messaggi")
+    parser.add_argument("--save", action="store_true", help="Salva raw/reassembled come in cattura live")
+    parser.add_argument("--verbose", action="store_true", help="Mostra il log DEBUG per pacchetto")
+    parser.add_argument("--fast", action="store_true", help="Legge i pcap classici senza dissezione scapy")
+    parser.add_argument("--start", help="Solo pacchetti da: ISO (2026-10-17T14:00) oppure HH:MM con --day")
+    parser.add_argument("--end", help="Solo pacchetti prima di (esclusa), stesso formato di --start")
+    parser.add_argument("--day", help="Giorno per gli orari HH:MM (default: oggi)")
+    parser.add_argument("--flow", help="Solo una connessione, IP:PORTA-IP:PORTA (entrambe le direzioni)")
+    args = parser.parse_args(argv)
+
+    try:
+        start = parse_time(args.start, args.day) if args.start else None
+        end = parse_time(args.end, args.day) if args.end else None
+        flow = parse_flow(args.flow) if args.flow else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.target:
+        os.environ["TARGETS"] = args.target
+
+    print(f"▶️  Replay di {len(args.files)} file ({'real-time' if args.realtime else 'massima velocità'})")
+    stats = replay_files(args.files, realtime=args.realtime, speed=args.speed,
+                         decode=args.decode, save=args.save, verbose=args.verbose, fast=args.fast,
+                         start=start, end=end, flow=flow)
+    print_report(stats)
+    return stats
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,9 @@
-from scapy.all import AsyncSniffer, Raw
 from datetime import datetime
 import json
+import logging
 import sys
 import time
 import threading
-import keyboard
-import pyautogui
 import os
 from dotenv import load_dotenv
 
@@ -13,7 +11,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # IMPORTO LE CLASSI DAL PRIMO FILE
-from packet_logic import CapturedPacket, StreamReassembler
+from packet_logic import CapturedPacket, FlowTable, StreamReassembler, FRAMING, PARSED_CACHE
+from capture_writer import CaptureWriter, BinaryCaptureWriter
+from fast_capture import FastSniffer
+from pipeline import Stage, ShardedStage, ShardedProcessStage, format_stats
+from targets import TargetSet, parse_targets, bpf_filter
+from metrics import METRICS, summary_line, setup_logging
+from correlator import Correlator, connection_of, epoch, format_rtt
+
+log = logging.getLogger("sniffer")
+PACKETS = METRICS.counter("packets")
+BYTES = METRICS.counter("bytes")
+KERNEL_DROPS = METRICS.counter("kernel_drops")
 
 # =============================
 #   CONFIGURAZIONE
@@ -21,29 +30,186 @@ from packet_logic import CapturedPacket, StreamReassembler
 TARGET_IP = os.getenv("TARGET_IP")
 TARGET_PORT = os.getenv("TARGET_PORT")
 
-if not TARGET_IP:
-    print("❌ Errore: TARGET_IP non trovato nel file .env")
+# Rotazione dei file di cattura (MB non compressi / secondi)
+CAPTURE_ROTATE_MB = int(os.getenv("CAPTURE_ROTATE_MB", "64"))
+CAPTURE_ROTATE_SECONDS = int(os.getenv("CAPTURE_ROTATE_SECONDS", "3600"))
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "10000"))
+# "bin": record binari + indice (.gpk), "jsonl": righe JSON compresse
+CAPTURE_FORMAT = os.getenv("CAPTURE_FORMAT", "bin")
+# "scapy": AsyncSniffer (default, multipiattaforma), "fast": socket AF_PACKET (Linux)
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "scapy")
+CAPTURE_INTERFACE = os.getenv("CAPTURE_INTERFACE") or None
+# Più server / emulatori: "IP[:PORTA][@INTERFACCIA], ..." (vuoto = TARGET_IP/TARGET_PORT)
+TARGETS = TargetSet(parse_targets(os.getenv("TARGETS") or TARGET_IP, TARGET_PORT, CAPTURE_INTERFACE))
+# Worker di elaborazione (0 = automatico): ogni connessione TCP resta sempre sullo
+# stesso worker. Con più di uno ogni worker è un processo, così reassembling e
+# json.loads usano più core; un core resta al processo di cattura e salvataggio
+CAPTURE_WORKERS = int(os.getenv("CAPTURE_WORKERS", "0")) or max(min((os.cpu_count() or 1) - 1, 8), 1)
+
+if not TARGETS:
+    print("❌ Errore: né TARGETS né TARGET_IP trovati nel file .env")
     sys.exit(1)
+# Coda tra thread di cattura e stadio di elaborazione (reassembling/parsing)
+PROCESS_QUEUE_SIZE = int(os.getenv("PROCESS_QUEUE_SIZE", "50000"))
+# Resync del reassembler: delimitatore di messaggio (vuoto = appreso dal traffico,
+# es. "%xt%" o "\\x00") e limite rigido del JSON in costruzione
+FRAMING_DELIMITER = os.getenv("FRAMING_DELIMITER", "")
+REASSEMBLY_MAX_MB = int(os.getenv("REASSEMBLY_MAX_MB", "32"))
+# Payload ripetuti identici: cache dei JSON già analizzati (MB, 0 = spenta) e
+# riferimenti al posto delle copie nei file dei messaggi ricostruiti
+PAYLOAD_CACHE_MB = int(os.getenv("PAYLOAD_CACHE_MB", "64"))
+CAPTURE_DEDUP = os.getenv("CAPTURE_DEDUP", "1") == "1"
+# Richieste senza risposta oltre questo tempo vengono contate come perse
+EXCHANGE_TIMEOUT = float(os.getenv("EXCHANGE_TIMEOUT", "30"))
+INVESTIGATION_TIMEOUT = 5.0 # Attesa massima dello scambio dopo il click
+STATUS_INTERVAL = 30
+# Streaming locale di messaggi ricostruiti e decodificati (SSE / WebSocket)
+STREAM_SERVER = os.getenv("STREAM_SERVER", "1") == "1"
+FLASK_HOST = os.getenv("FLASK_HOST", "127.0.0.1")
+FLASK_PORT = int(os.getenv("FLASK_PORT", "9000"))
+BASE_DIR = "captured_data"
 
 # =============================
 #   STATO GLOBALE
 # =============================
-PACKET_STORE = []
-REASSEMBLED_MESSAGES = []
+# I pacchetti non restano in RAM: vengono scritti su disco in streaming
+RAW_WRITER_CLASS = BinaryCaptureWriter if CAPTURE_FORMAT == "bin" else CaptureWriter
+RAW_WRITER = RAW_WRITER_CLASS(os.path.join(BASE_DIR, "raw"), "captured_raw",
+                               max_bytes=CAPTURE_ROTATE_MB * 1024 * 1024,
+                               rotate_seconds=CAPTURE_ROTATE_SECONDS,
+                               queue_size=CAPTURE_QUEUE_SIZE)
+REASSEMBLED_WRITER = CaptureWriter(os.path.join(BASE_DIR, "reassembled"), "reassembled",
+                                   max_bytes=CAPTURE_ROTATE_MB * 1024 * 1024,
+                                   rotate_seconds=CAPTURE_ROTATE_SECONDS,
+                                   queue_size=CAPTURE_QUEUE_SIZE,
+                                   dedup=CAPTURE_DEDUP, index=True)
+PARSED_CACHE.max_bytes = PAYLOAD_CACHE_MB * 1024 * 1024
 INVESTIGATION_PACKETS = []
 
 INVESTIGATION_MODE = False
 INVESTIGATION_LOCK = threading.Lock()
+INVESTIGATION_START = 0.0
+INVESTIGATION_EXCHANGE = None
+INVESTIGATION_DONE = threading.Event()
 
-# Istanza del reassembler (dal file esterno)
-reassembler = StreamReassembler()
+# Attivati da start_stream(): server e stadio di decodifica per gli abbonati
+STREAM = None
+DECODING = None
 
 # =============================
 #   LOGICA SNIFFER
 # =============================
 
+def store_messages(messages):
+    """Salvataggio e streaming dei JSON completati (server -> client)."""
+    for msg in messages:
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("🧩 [JSON RICOSTRUITO] Dimensione: %d chars", len(str(msg['payload'])))
+        REASSEMBLED_WRITER.write(msg)
+        if STREAM is not None:
+            STREAM.publish("message", msg)
+            DECODING.put(msg)
+
+# Un reassembler per connessione TCP (dal file esterno)
+FLOW_IDLE_TIMEOUT = float(os.getenv("FLOW_IDLE_TIMEOUT", "300"))
+if FRAMING_DELIMITER:
+    FRAMING.configure(FRAMING_DELIMITER.encode("latin-1").decode("unicode_escape").encode("latin-1"))
+
+def new_reassembler(consumer):
+    return StreamReassembler(consumer, max_buffer=REASSEMBLY_MAX_MB * 1024 * 1024)
+
+def new_client_reassembler(consumer):
+    return StreamReassembler(consumer, max_buffer=REASSEMBLY_MAX_MB * 1024 * 1024, client=True)
+
+def on_exchange(exchange):
+    """Nuovo scambio richiesta/risposta: streaming e chiusura dell'investigazione."""
+    global INVESTIGATION_EXCHANGE
+    if STREAM is not None:
+        STREAM.publish("exchange", {k: exchange[k] for k in ("command", "request_time", "response_time", "rtt")})
+    with INVESTIGATION_LOCK:
+        if INVESTIGATION_MODE and INVESTIGATION_EXCHANGE is None and exchange["request_time"] >= INVESTIGATION_START:
+            INVESTIGATION_EXCHANGE = exchange
+            INVESTIGATION_DONE.set()
+
+def deliver_response(key, messages, timestamp=None):
+    """Messaggi server -> client: salvataggio, streaming e correlazione."""
+    target = TARGETS.server(key[0], key[1])
+    if target is not None:
+        target.messages.inc(len(messages))
+    store_messages(messages)
+    with CORRELATOR_LOCK:
+        CORRELATOR.response(connection_of(key, True), messages, timestamp)
+
+def deliver_request(key, messages, timestamp=None):
+    """Messaggi client -> server: solo per la correlazione."""
+    with CORRELATOR_LOCK:
+        CORRELATOR.request(connection_of(key, False), messages)
+
+class Shard:
+    """
+    Stato di reassembling di un worker: server -> client (salvato e decodificato)
+    e client -> server (solo per la correlazione). Solo il worker lo modifica.
+    I messaggi completati vanno a on_response / on_request: direttamente a
+    deliver_* nel processo principale, al principale via coda in un worker.
+    """
+
+    def __init__(self, on_response=None, on_request=None):
+        self.flow_table = FlowTable(idle_timeout=FLOW_IDLE_TIMEOUT, reassembler_factory=new_reassembler)
+        self.client_flows = FlowTable(idle_timeout=FLOW_IDLE_TIMEOUT,
+                                      reassembler_factory=new_client_reassembler)
+        self.on_response = on_response
+        self.on_request = on_request
+
+    def deliver(self, key, messages, from_server, timestamp=None):
+        if not messages:
+            return
+        if from_server:
+            (self.on_response or deliver_response)(key, messages, timestamp)
+        else:
+            (self.on_request or deliver_request)(key, messages, timestamp)
+
+    def tick(self):
+        for key, messages in self.flow_table.tick():
+            self.deliver(key, messages, True)
+        for key, messages in self.client_flows.tick():
+            self.deliver(key, messages, False)
+
+    def flush(self):
+        for key, messages in self.flow_table.flush():
+            self.deliver(key, messages, True)
+        for key, messages in self.client_flows.flush():
+            self.deliver(key, messages, False)
+
+SHARDS = [Shard() for _ in range(CAPTURE_WORKERS)]
+CORRELATOR = Correlator(timeout=EXCHANGE_TIMEOUT, on_exchange=on_exchange)
+CORRELATOR_LOCK = threading.Lock() # Condiviso tra i worker
+
+def shard_index(pkt, flags=0):
+    """Worker della connessione: stessa scelta per le due direzioni."""
+    a, b = (pkt.src, pkt.sport), (pkt.dst, pkt.dport)
+    return hash((a, b) if a < b else (b, a)) % len(SHARDS)
+
+def shard_worker(emit):
+    """
+    Handler di un processo worker (ShardedProcessStage): uno Shard proprio, i
+    messaggi tornano al principale come (dal server?, connessione, messaggi, ora).
+    """
+    setup_logging()
+    shard = Shard(lambda key, messages, timestamp: emit(True, key, messages, timestamp),
+                  lambda key, messages, timestamp: emit(False, key, messages, timestamp))
+    return lambda pkt, flags=0: reassemble_packet(shard, pkt, flags)
+
+def on_shard_result(from_server, key, messages, timestamp):
+    """Risultati dei processi worker, nel processo principale."""
+    (deliver_response if from_server else deliver_request)(key, messages, timestamp)
+
+# Destinazione dei pacchetti dissezionati da scapy: in cattura live il router
+# verso i worker, in replay direttamente process_packet
+DISPATCH = None
+
 def handle_packet(packet):
-    timestamp = datetime.now().isoformat()
+    # Orario di cattura del pacchetto (uguale a now() live, corretto in replay)
+    timestamp = datetime.fromtimestamp(float(packet.time)).isoformat()
 
     # Estrazione IP
     if packet.haslayer("IP"):
@@ -52,50 +218,122 @@ def handle_packet(packet):
         return
 
     # Estrazione Porte
+    seq, flags = None, 0
     if packet.haslayer("TCP"):
         sport, dport, protocol = packet["TCP"].sport, packet["TCP"].dport, "TCP"
+        seq, flags = packet["TCP"].seq, int(packet["TCP"].flags)
     elif packet.haslayer("UDP"):
         sport, dport, protocol = packet["UDP"].sport, packet["UDP"].dport, "UDP"
     else:
         return
 
-    # Estrazione Dati
-    data_str = ""
-    if packet.haslayer(Raw):
-        try:
-            data_str = packet[Raw].load.decode(errors="ignore")
-        except:
-            data_str = str(packet[Raw].load)
+    # Estrazione Dati (byte grezzi: la decodifica avviene solo sui messaggi completi)
+    raw_load = packet["Raw"].load if packet.haslayer("Raw") else b""
+
+    pkt = CapturedPacket(timestamp, src, dst, sport, dport, protocol, raw_load, seq)
+    (DISPATCH or process_packet)(pkt, flags)
 
-    if not data_str:
+def process_packet(pkt, flags=0):
+    """Pipeline comune a cattura live e replay: salvataggio, investigazione, reassembling."""
+    record_packet(pkt)
+    reassemble_packet(SHARDS[shard_index(pkt)], pkt, flags)
+
+def record_packet(pkt):
+    """Parte nel processo principale: salvataggio, contatori e investigazione."""
+    if not pkt.data:
         return
 
-    # 1. Creazione oggetto Pacchetto (usando la classe importata)
-    pkt = CapturedPacket(timestamp, src, dst, sport, dport, protocol, data_str)
-    PACKET_STORE.append(pkt)
+    # 1. Salvataggio del pacchetto (CapturedPacket dalla classe importata)
+    RAW_WRITER.write(pkt)
+    PACKETS.inc()
+    BYTES.inc(len(pkt.data))
 
-    # Stampa a video ricezione
-    print(f"📦 [{timestamp[-15:]}] RX {src}:{sport} -> {len(data_str)} bytes")
+    # Ricezione a video solo con LOG_LEVEL=DEBUG
+    log.debug("📦 [%s] RX %s:%s -> %d bytes", pkt.timestamp[-15:], pkt.src, pkt.sport, len(pkt.data))
 
     # Gestione Investigazione
     with INVESTIGATION_LOCK:
         if INVESTIGATION_MODE:
             INVESTIGATION_PACKETS.append(pkt)
 
-    # 2. Logica Reassembling (Solo traffico in entrata dal server)
-    if src == TARGET_IP:
-        json_result = reassembler.add_fragment(data_str, timestamp)
-        if json_result:
-            size = len(str(json_result['payload']))
-            print(f"🧩 [JSON RICOSTRUITO] Dimensione: {size} chars")
-            REASSEMBLED_MESSAGES.append(json_result)
+    if pkt.protocol == "TCP":
+        target = TARGETS.server(pkt.src, pkt.sport) or TARGETS.server(pkt.dst, pkt.dport)
+        if target is not None:
+            target.packets.inc()
+
+def reassemble_packet(shard, pkt, flags=0):
+    """2. Logica Reassembling: entrambe le direzioni, poi correlazione richiesta/risposta."""
+    if pkt.protocol != "TCP":
+        return
+    flow_key = (pkt.src, pkt.sport, pkt.dst, pkt.dport)
+    shard.tick() # Buchi scaduti anche sui flussi fermi (gli ACK arrivano comunque)
+    if not pkt.data:
+        # Segmento senza dati: ci interessano apertura e chiusura della connessione
+        if flags & 0x02 and pkt.seq is not None: # SYN / SYN-ACK: inizio del flusso
+            if TARGETS.server(pkt.src, pkt.sport) is not None:
+                shard.deliver(flow_key, shard.flow_table.syn(flow_key, pkt.seq), True)
+            elif TARGETS.server(pkt.dst, pkt.dport) is not None:
+                shard.deliver(flow_key, shard.client_flows.syn(flow_key, pkt.seq), False)
+        if flags & 0x05: # FIN | RST
+            shard.deliver(flow_key, shard.flow_table.close(flow_key), True, pkt.timestamp)
+            shard.deliver(flow_key, shard.client_flows.close(flow_key), False)
+        return
+
+    if TARGETS.server(pkt.src, pkt.sport) is not None:
+        messages = shard.flow_table.add_segment(flow_key, pkt.seq, pkt.data, pkt.timestamp)
+        shard.deliver(flow_key, messages, True, pkt.timestamp)
+    elif TARGETS.server(pkt.dst, pkt.dport) is not None:
+        messages = shard.client_flows.add_segment(flow_key, pkt.seq, pkt.data, pkt.timestamp)
+        shard.deliver(flow_key, messages, False)
+
+def decode_and_publish(msg):
+    """Stadio di decodifica: il risultato di process_game_data va agli abbonati."""
+    from decode_json import decode_record
+
+    result = decode_record(msg) # Payload già visti: risultato dalla cache
+    if result:
+        STREAM.publish("decoded", {"timestamp": msg["timestamp"], "command": msg.get("command"), "data": result})
+
+def collect_kernel_drops(sniffers):
+    """Scarti del kernel dall'ultima lettura (solo backend AF_PACKET; scapy non li espone)."""
+    for sniffer in sniffers:
+        if isinstance(sniffer, FastSniffer):
+            try:
+                _, drops = sniffer.stats()
+            except OSError:
+                continue # Socket già chiuso
+            KERNEL_DROPS.inc(drops)
+
+def report_status(stages, sniffers):
+    """Riga periodica: stadi della pipeline e metriche del percorso caldo."""
+    collect_kernel_drops(sniffers)
+    print(f"📈 {format_stats(stages)}")
+    print(f"⏱️  {summary_line()}")
+    if len(TARGETS) > 1:
+        print("🎯 " + " | ".join(f"{t.name}: pkt {t.packets.value} msg {t.messages.value}" for t in TARGETS))
+
+def start_stream():
+    """Avvia il server di streaming e lo stadio che decodifica fuori dal percorso di cattura."""
+    global STREAM, DECODING
+    import decode_json
+    from stream_server import StreamServer
+    decode_json.VERBOSE = False # Le stampe per messaggio rallenterebbero la decodifica
+
+    DECODING = Stage("decodifica", decode_and_publish, maxsize=PROCESS_QUEUE_SIZE).start()
+    STREAM = StreamServer(FLASK_HOST, FLASK_PORT).start()
+    print(f"📡 Streaming su http://{FLASK_HOST}:{FLASK_PORT} (/events SSE, /ws WebSocket)")
+
+def stop_stream():
+    if STREAM is not None:
+        DECODING.close()
+        STREAM.stop()
 
 # =============================
 #   SALVATAGGIO FILE
 # =============================
 
 def ensure_directories():
-    base = "captured_data"
+    base = BASE_DIR
     subdirs = ["raw", "investigation", "reassembled"]
     
     if not os.path.exists(base):
@@ -110,54 +348,79 @@ def ensure_directories():
 def get_timestamp():
     return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
+def start_writers():
+    ensure_directories()
+    RAW_WRITER.start()
+    REASSEMBLED_WRITER.start()
+
 def save_all_data():
     print("\n💾 Salvataggio dati in corso...")
-    base_dir = ensure_directories()
-    ts = get_timestamp()
-    
-    # Salva RAW
-    path_raw = os.path.join(base_dir, "raw", f"captured_raw_{ts}.json")
-    with open(path_raw, "w", encoding="utf-8") as f:
-        json.dump([p.to_dict() for p in PACKET_STORE], f, indent=4)
-    
-    # Salva RICOSTRUITI
-    path_reass = os.path.join(base_dir, "reassembled", f"reassembled_{ts}.json")
-    with open(path_reass, "w", encoding="utf-8") as f:
-        json.dump(REASSEMBLED_MESSAGES, f, indent=4)
-        
-    print(f"✅ Dati salvati in '{base_dir}':\n   - {path_raw}\n   - {path_reass}")
+    # I dati sono già su disco: svuotiamo le code e chiudiamo i file
+    files = RAW_WRITER.close() + REASSEMBLED_WRITER.close()
+
+    dropped = RAW_WRITER.dropped + REASSEMBLED_WRITER.dropped
+    if dropped:
+        print(f"⚠️ {dropped} record scartati per coda di scrittura piena")
 
-def save_investigation():
+    print(f"✅ Dati salvati in '{BASE_DIR}':")
+    for path in files:
+        print(f"   - {path}")
+
+def exchange_packets(packets, exchange):
+    """Solo i pacchetti della connessione dello scambio, dalla richiesta alla fine della risposta."""
+    client, cport, server, sport = exchange["connection"]
+    ends = {(client, cport), (server, sport)}
+    start, end = exchange["request_time"], exchange["end_time"]
+    return [p for p in packets
+            if {(p.src, p.sport), (p.dst, p.dport)} == ends and start <= epoch(p.timestamp) <= end]
+
+def save_investigation(exchange=None):
     base_dir = ensure_directories()
     ts = get_timestamp()
     path_inv = os.path.join(base_dir, "investigation", f"investigation_{ts}.json")
-    
+
+    packets = INVESTIGATION_PACKETS if exchange is None else exchange_packets(INVESTIGATION_PACKETS, exchange)
     with open(path_inv, "w", encoding="utf-8") as f:
-        json.dump([p.to_dict() for p in INVESTIGATION_PACKETS], f, indent=4)
-    print(f"🔍 Investigazione salvata in {path_inv}")
+        json.dump([p.to_dict() for p in packets], f, indent=4)
+    print(f"🔍 Investigazione salvata in {path_inv} ({len(packets)} pacchetti)")
+
+    if exchange is not None:
+        path_ex = os.path.join(base_dir, "investigation", f"investigation_{ts}_exchange.json")
+        with open(path_ex, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in exchange.items() if k != "connection"}, f, indent=4)
+        print(f"⏱️  Scambio '{exchange['command']}': {exchange['rtt'] * 1000:.1f} ms -> {path_ex}")
 
 # =============================
 #   INTERAZIONE UTENTE
 # =============================
 
 def run_investigation():
-    global INVESTIGATION_MODE, INVESTIGATION_PACKETS
+    global INVESTIGATION_MODE, INVESTIGATION_PACKETS, INVESTIGATION_START, INVESTIGATION_EXCHANGE
     print("\n🔬 INVESTIGAZIONE AVVIATA (Click tra 5s)...")
     time.sleep(5)
-    
-    print("🖱️  CLICK!")
-    pyautogui.click()
-    
+
     with INVESTIGATION_LOCK:
         INVESTIGATION_PACKETS = []
+        INVESTIGATION_EXCHANGE = None
+        INVESTIGATION_START = time.time()
         INVESTIGATION_MODE = True
-    
-    time.sleep(0.5) # Cattura per 0.5s dopo il click
-    
+        INVESTIGATION_DONE.clear()
+
+    print("🖱️  CLICK!")
+    import pyautogui # Serve una sessione desktop: importato solo al primo click
+    pyautogui.click()
+
+    # Si cattura fino alla prima risposta a una richiesta partita dopo il click
+    found = INVESTIGATION_DONE.wait(INVESTIGATION_TIMEOUT)
+    time.sleep(0.5) # Eventuali risposte in più parti
+
     with INVESTIGATION_LOCK:
         INVESTIGATION_MODE = False
-    
-    save_investigation()
+        exchange = INVESTIGATION_EXCHANGE
+
+    if not found:
+        print(f"⚠️ Nessuno scambio completato in {INVESTIGATION_TIMEOUT:.0f}s: salvo tutti i pacchetti")
+    save_investigation(exchange)
     print("✅ Investigazione conclusa.\n")
 
 def trigger_investigation():
@@ -168,35 +431,97 @@ def trigger_investigation():
 #   MAIN
 # =============================
 
-if __name__ == "__main__":
-    print(f"🚀 Sniffer attivo su {TARGET_IP}")
-    
-    # Costruzione filtro
-    sniff_filter = f"tcp and host {TARGET_IP}"
-    if TARGET_PORT:
-        sniff_filter += f" and port {TARGET_PORT}"
-        print(f"🎯 Filtro porta attivo: {TARGET_PORT}")
-
+def main():
+    """
+    Cattura live. scapy, keyboard e pyautogui vengono importati solo qui (e nel
+    click dell'investigazione): replay e strumenti offline non ne hanno bisogno.
+    """
+    global DISPATCH
+    setup_logging()
+    print(f"🚀 Sniffer attivo su {', '.join(t.name for t in TARGETS)} ({CAPTURE_WORKERS} worker)")
     print("CMD: [CTRL+C] Stop & Save | [CTRL+M] Click & Investigate")
 
     try:
+        import keyboard
         keyboard.add_hotkey('ctrl+m', trigger_investigation)
     except ImportError:
         print("⚠️ Libreria 'keyboard' non trovata (pip install keyboard)")
 
-    sniffer = AsyncSniffer(
-        filter=sniff_filter,
-        prn=handle_packet,
-        store=False
-    )
+    # Il callback di cattura si limita ad accodare: reassembling e parsing girano
+    # nei worker, uno per connessione, e non rallentano lo sniffer. Con più worker
+    # sono processi: il principale salva i pacchetti e riceve i messaggi completi
+    if CAPTURE_WORKERS > 1:
+        processing = ShardedProcessStage("elaborazione", shard_worker, CAPTURE_WORKERS, shard_index,
+                                         on_shard_result, maxsize=PROCESS_QUEUE_SIZE)
+
+        def route(pkt, flags=0):
+            record_packet(pkt)
+            processing.put(pkt, flags)
+    else:
+        processing = ShardedStage("elaborazione", process_packet, 1, shard_index,
+                                  maxsize=PROCESS_QUEUE_SIZE)
+        route = processing.put
+    dissectors, sniffers = [], []
+
+    # Uno sniffer (un thread di cattura) per interfaccia, con i soli target di quell'interfaccia
+    for interface, group in TARGETS.by_interface().items():
+        label = interface or "tutte"
+        if CAPTURE_BACKEND == "fast":
+            # Header letti con struct dal socket AF_PACKET, senza dissezione scapy
+            print(f"⚡ Cattura veloce su {label}: {', '.join(t.name for t in group)}")
+            sniffers.append(FastSniffer(
+                prn=route,
+                interface=interface,
+                targets=[(t.ip, t.port) for t in group]
+            ))
+        else:
+            from scapy.all import AsyncSniffer
+            sniff_filter = bpf_filter(group)
+            print(f"🎯 Cattura su {label}: {sniff_filter}")
+            # La dissezione scapy ha un suo stadio per interfaccia, poi il router verso i worker
+            dissect = Stage(f"cattura-{label}", handle_packet, maxsize=PROCESS_QUEUE_SIZE)
+            dissectors.append(dissect)
+            sniffers.append(AsyncSniffer(
+                filter=sniff_filter,
+                prn=dissect.put,
+                store=False,
+                iface=interface
+            ))
+    DISPATCH = route
+    stages = dissectors + processing.stages
 
     try:
-        sniffer.start()
+        start_writers()
+        if STREAM_SERVER:
+            start_stream()
+        processing.start()
+        for stage in dissectors:
+            stage.start()
+        for sniffer in sniffers:
+            sniffer.start()
+        last_status = time.monotonic()
         while True:
             time.sleep(1)
-            
+            if time.monotonic() - last_status >= STATUS_INTERVAL:
+                last_status = time.monotonic()
+                report_status(stages + ([DECODING] if DECODING else []), sniffers)
+
     except KeyboardInterrupt:
         print("\n🛑 Arresto richiesto...")
-        sniffer.stop()
+        collect_kernel_drops(sniffers)
+        for sniffer in sniffers:
+            sniffer.stop()
+        # Prima gli stadi di dissezione (svuotano verso i worker), poi i worker
+        for stage in dissectors:
+            stage.close()
+        processing.close()
+        stop_stream()
+        report_status(stages + ([DECODING] if DECODING else []), sniffers)
+        if CORRELATOR.counts:
+            print(f"\n⏱️  Tempi di risposta per comando:\n{format_rtt(CORRELATOR.stats())}")
         save_all_data()
-        sys.exit(0)
\ No newline at end of file
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+from decode_json import to_json
+from metrics import METRICS
+
+# =============================
+#   SERVER DI STREAMING LOCALE
+# =============================
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+CLIENT_BUFFER = 1000        # Eventi in attesa per client (oltre: si scartano i più vecchi)
+MAX_BODY = 16 * 1024 * 1024 # Limite per i POST su /data
+
+
+class Client:
+    """Un abbonato: coda limitata propria, filtrabile per tipo di evento."""
+
+    def __init__(self, kind, types, buffer_size):
+        self.kind = kind                # "sse" o "ws"
+        self.types = types              # None = tutti i tipi
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def push(self, kind, text):
+        if self.types and kind not in self.types:
+            return
+        if self.queue.full():
+            # Client lento: perde gli eventi più vecchi, mai la cattura
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((kind, text))
+
+
+class StreamServer:
+    """
+    Server asyncio (HTTP + SSE + WebSocket) in un thread proprio.
+
+    - GET  /status         statistiche in JSON
+    - GET  /metrics        contatori e istogrammi del percorso caldo (metrics.METRICS)
+    - GET  /events         Server-Sent Events (?type=message,decoded per filtrare)
+    - GET  /ws             WebSocket, un evento JSON per frame di testo
+    - POST /data           riceve JSON esterni (MITM_ENDPOINT) e li ripubblica come "mitm"
+
+    publish() è chiamabile da qualsiasi thread e non blocca: l'evento passa al
+    loop con call_soon_threadsafe e ogni client ha il proprio buffer limitato.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9000, buffer_size=CLIENT_BUFFER):
+        self.host = host
+        self.port = int(port)
+        self.buffer_size = buffer_size
+        self.clients = set()
+        self.published = 0
+        self.dropped = 0
+
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stream-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def publish(self, kind, data):
+        """Pubblica un evento a tutti i client (thread-safe, non bloccante)."""
+        if self._loop is None or not self.clients:
+            return
+        self.published += 1
+        self._loop.call_soon_threadsafe(self._fanout, kind, data)
+
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "published": self.published,
+            "dropped": self.dropped + sum(c.dropped for c in self.clients),
+        }
+
+    # --- Loop asyncio ---
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port))
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            # Chiude le connessioni ancora aperte prima di chiudere il loop
+            self._server.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    def _fanout(self, kind, data):
+        # Serializzazione una sola volta per evento, nel thread del server
+        text = json.dumps({"type": kind, **data}, ensure_ascii=False, default=to_json)
+        for client in list(self.clients):
+            client.push(kind, text)
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+
+            method, target = request_line[0], request_line[1]
+            url = urlsplit(target)
+            query = parse_qs(url.query)
+            types = set(",".join(query.get("type", [])).split(",")) - {""} or None
+
+            if method == "GET" and url.path == "/events":
+                await self._serve_sse(writer, types)
+            elif method == "GET" and url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                await self._serve_ws(reader, writer, headers, types)
+            elif method == "GET" and url.path == "/metrics":
+                await self._respond(writer, 200, METRICS.snapshot())
+            elif method == "GET" and url.path in ("/", "/status"):
+                await self._respond(writer, 200, self.stats())
+            elif method == "POST" and url.path == "/data":
+                await self._receive(reader, writer, headers)
+            else:
+                await self._respond(writer, 404, {"error": "not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass    # Arresto del server con client ancora collegati
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}.get(status, "")
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _receive(self, reader, writer, headers):
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY:
+            await self._respond(writer, 413, {"error": "body troppo grande"})
+            return
+        body = await reader.readexactly(length)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            await self._respond(writer, 400, {"error": "JSON non valido"})
+            return
+        self._fanout("mitm", {"payload": data})
+        await self._respond(writer, 200, {"ok": True})
+
+    # --- SSE ---
+
+    async def _serve_sse(self, writer, types):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+        await writer.drain()
+
+        client = Client("sse", types, self.buffer_size)
+        self.clients.add(client)
+        try:
+            while True:
+                kind, text = await client.queue.get()
+                writer.write(f"event: {kind}\ndata: {text}\n\n".encode("utf-8"))
+                await writer.drain()
+        finally:
+            self._forget(client)
+
+    # --- WebSocket ---
+
+    async def _serve_ws(self, reader, writer, headers, types):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("latin-1")).digest()).decode("latin-1")
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept.encode("latin-1") + b"\r\n\r\n")
+        await writer.drain()
+
+        client = Client("ws", types, self.buffer_size)
+        self.clients.add(client)
+        # I frame del client servono solo per ping e chiusura
+        control = asyncio.ensure_future(self._ws_control(reader, writer))
+        try:
+            while not control.done():
+                getter = asyncio.ensure_future(client.queue.get())
+                done, _ = await asyncio.wait({getter, control}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    break
+                kind, text = getter.result()
+                writer.write(ws_frame(0x1, text.encode("utf-8")))
+                await writer.drain()
+        finally:
+            control.cancel()
+            self._forget(client)
+
+    async def _ws_control(self, reader, writer):
+        while True:
+            head = await reader.readexactly(2)
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await reader.readexactly(8))[0]
+            mask = await reader.readexactly(4) if head[1] & 0x80 else b"\x00\x00\x00\x00"
+            data = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+
+            if opcode == 0x8:       # Close
+                writer.write(ws_frame(0x8, data[:2]))
+                return
+            if opcode == 0x9:       # Ping -> Pong
+                writer.write(ws_frame(0xA, data))
+
+    def _forget(self, client):
+        self.clients.discard(client)
+        self.dropped += client.dropped
+
+
+def ws_frame(opcode, payload):
+    """Frame WebSocket dal server (FIN, senza maschera)."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
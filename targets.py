@@ -0,0 +1,87 @@
+import socket
+
+from metrics import METRICS
+
+# =============================
+#   SERVER DI GIOCO DA CATTURARE
+# =============================
+
+
+class Target:
+    """Un server di gioco: IP, porta opzionale e interfaccia su cui catturarlo (None = tutte)."""
+
+    def __init__(self, ip, port=None, interface=None):
+        socket.inet_aton(ip) # Solo IPv4, come il filtro del backend veloce
+        self.ip = ip
+        self.port = int(port) if port else None
+        self.interface = interface or None
+        self.name = f"{ip}:{self.port}" if self.port else ip
+        self.packets = METRICS.counter(f"target_{self.name}_packets")
+        self.messages = METRICS.counter(f"target_{self.name}_messages")
+
+    def matches(self, ip, port):
+        return ip == self.ip and (self.port is None or port == self.port)
+
+    def __repr__(self):
+        return f"Target({self.name}@{self.interface or '*'})"
+
+
+def parse_targets(text, default_port=None, default_interface=None):
+    """
+    Lista di server da TARGETS: "IP[:PORTA][@INTERFACCIA]" separati da virgole,
+    es. "10.0.0.5:443@eth0, 10.0.0.6:443@eth1, 52.1.2.3".
+    Porta e interfaccia mancanti prendono i default (TARGET_PORT / CAPTURE_INTERFACE).
+    """
+    targets = []
+    for entry in filter(None, (e.strip() for e in (text or "").split(","))):
+        address, _, interface = entry.partition("@")
+        ip, _, port = address.partition(":")
+        try:
+            targets.append(Target(ip.strip(), port.strip() or default_port,
+                                  interface.strip() or default_interface))
+        except (OSError, ValueError):
+            raise ValueError(f"target non valido: '{entry}' (atteso IP[:PORTA][@INTERFACCIA])")
+    return targets
+
+
+class TargetSet:
+    """I server configurati: direzione dei pacchetti e raggruppamento per interfaccia."""
+
+    def __init__(self, targets):
+        self.targets = list(targets)
+        self._by_ip = {}
+        for target in self.targets:
+            self._by_ip.setdefault(target.ip, []).append(target)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __iter__(self):
+        return iter(self.targets)
+
+    def server(self, ip, port):
+        """Target a cui appartiene l'estremo (ip, porta), o None se è un client."""
+        for target in self._by_ip.get(ip, ()):
+            if target.port is None or port == target.port:
+                return target
+        return None
+
+    def by_interface(self):
+        """{interfaccia: [target]}: uno sniffer per interfaccia, con un solo filtro."""
+        groups = {}
+        for target in self.targets:
+            groups.setdefault(target.interface, []).append(target)
+        return groups
+
+
+def bpf_filter(targets):
+    """Filtro BPF che cattura il traffico TCP di tutti i target indicati."""
+    clauses = []
+    for target in targets:
+        clause = f"host {target.ip}"
+        if target.port:
+            clause = f"({clause} and port {target.port})"
+        clauses.append(clause)
+    if len(clauses) == 1:
+        return f"tcp and {clauses[0]}"
+    return f"tcp and ({' or '.join(clauses)})"
@@ -0,0 +1,279 @@
+import argparse
+import heapq
+import json
+import math
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from capture_writer import list_capture_files, capture_time_range, read_window
+
+# =============================
+#   AGGREGAZIONE PER FINESTRE TEMPORALI
+# =============================
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhd]?)$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text):
+    """'300', '30s', '5m', '1h' -> secondi."""
+    match = _DURATION.match(text.strip().lower())
+    if not match:
+        raise ValueError(f"durata non valida: '{text}' (es. 30s, 5m, 1h)")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def parse_time(text, day=None):
+    """Orario ISO completo, oppure 'HH:MM[:SS]' del giorno indicato (default oggi) -> epoch."""
+    text = text.strip()
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        pass
+    clock = datetime.strptime(text, "%H:%M:%S" if text.count(":") == 2 else "%H:%M").time()
+    day = datetime.fromisoformat(day).date() if day else datetime.now().date()
+    return datetime.combine(day, clock).timestamp()
+
+
+def select_files(paths, start=None, end=None):
+    """
+    File (con il loro intervallo) che possono avere messaggi nella finestra:
+    l'intervallo viene dall'indice a blocchi o dal primo record, senza leggere il file.
+    """
+    selected = []
+    for path in paths:
+        if path.endswith(".gpk"):
+            continue # Pacchetti grezzi, non messaggi
+        span = capture_time_range(path)
+        if span is None:
+            continue
+        first, last = span
+        if (end is None or first < end) and (start is None or last >= start):
+            selected.append(path)
+    return selected
+
+
+def iter_messages(paths, start=None, end=None):
+    """(timestamp epoch, riga) di tutti i file selezionati, fusi in ordine di tempo."""
+    streams = [read_window(path, start, end) for path in select_files(paths, start, end)]
+    return heapq.merge(*streams, key=lambda item: item[0])
+
+
+class WindowStats:
+    """Statistiche di una finestra [start, end)."""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.messages = 0
+        self.bytes = 0
+        self.commands = Counter()       # comando -> messaggi
+        self.changes = Counter()        # tipo di differenza del roster -> quante
+        self.effects = {}               # ID effetto -> totale sul roster a fine finestra
+
+    def to_dict(self):
+        return {
+            "start": datetime.fromtimestamp(self.start).isoformat(),
+            "end": datetime.fromtimestamp(self.end).isoformat(),
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "commands": dict(self.commands.most_common()),
+            "changes": dict(self.changes),
+            "effects": {str(k): v for k, v in sorted(self.effects.items())},
+        }
+
+
+class WindowAggregator:
+    """
+    Raggruppa i messaggi (in ordine di tempo) in finestre di `size` secondi che
+    avanzano di `step` secondi: step == size finestre fisse, step < size finestre
+    scorrevoli (un messaggio conta in tutte quelle che lo contengono).
+
+    Le finestre sono allineate a `origin` (l'inizio richiesto, altrimenti un
+    multiplo di step) ed emesse appena il tempo dei messaggi le supera, anche
+    vuote: con l'inizio richiesto si parte dalla prima finestra e con la fine
+    si arriva fino a end, anche senza messaggi.
+
+    Le differenze del roster partono dal primo roster visto: quel primo
+    messaggio fa da riferimento e non viene contato come cambiamento. I totali
+    degli effetti sono quelli del roster alla fine di ogni finestra.
+    """
+
+    def __init__(self, size, step=None, origin=None, end=None, on_window=None):
+        from inventory_state import InventoryState
+
+        self.size = size
+        self.step = step or size
+        self.origin = origin
+        self.end = end
+        self.on_window = on_window
+        self.open = {}                  # indice della finestra -> WindowStats
+        self.next_index = None if origin is None else 0  # prossima finestra da emettere
+        self.late = 0                   # messaggi arrivati dopo la chiusura della loro finestra
+        self.state = InventoryState()
+        self.has_baseline = False
+        self._effects = {}
+        self._effects_stale = False
+
+    def _window(self, k):
+        stats = self.open.get(k)
+        if stats is None:
+            start = self.origin + k * self.step
+            stats = self.open[k] = WindowStats(start, start + self.size)
+        return stats
+
+    def _emit_until(self, t):
+        """Emette in ordine le finestre che finiscono entro t."""
+        while self.next_index is not None and self.origin + self.next_index * self.step + self.size <= t:
+            if self.end is not None and self.origin + self.next_index * self.step >= self.end:
+                self.next_index = None
+                break
+            stats = self._window(self.next_index)
+            del self.open[self.next_index]
+            stats.effects = self.effect_totals()
+            self.next_index += 1
+            if self.on_window:
+                self.on_window(stats)
+
+    def effect_totals(self):
+        """Somma di ogni effetto su tutto l'equipaggiamento attuale (ricalcolata solo se cambia)."""
+        if self._effects_stale:
+            totals = {}
+            for items in self.state.items.values():
+                for item in items.values():
+                    for effect in item.effects:
+                        totals[effect.effect_id] = totals.get(effect.effect_id, 0) + effect.total
+            self._effects = totals
+            self._effects_stale = False
+        return dict(self._effects)
+
+    def add(self, t, record, decoded=None):
+        if self.origin is None:
+            self.origin = math.floor(t / self.step) * self.step
+        if self.next_index is None:
+            self.next_index = max(0, math.floor((t - self.origin - self.size) / self.step) + 1)
+
+        # Prima si chiudono le finestre passate: lo stato del roster è quello alla loro fine
+        self._emit_until(t)
+
+        first = max(math.floor((t - self.origin - self.size) / self.step) + 1, 0)
+        last = math.floor((t - self.origin) / self.step)
+        if first < self.next_index:
+            self.late += 1
+            first = self.next_index
+        windows = [self._window(k) for k in range(first, last + 1)]
+
+        command = record.get("command") if isinstance(record, dict) else _command_of(record)
+        size = len(record) if isinstance(record, str) else len(json.dumps(record, ensure_ascii=False))
+        for stats in windows:
+            stats.messages += 1
+            stats.bytes += size
+            stats.commands[command or "?"] += 1
+
+        if decoded:
+            deltas = self.state.apply(decoded)
+            if deltas:
+                self._effects_stale = True
+            if not self.has_baseline:
+                self.has_baseline = True
+                self._effects_stale = True
+                return
+            for delta in deltas:
+                for stats in windows:
+                    stats.changes[delta["type"]] += 1
+
+    def finish(self):
+        """Emette le finestre rimaste (fino a end, se indicato)."""
+        if self.next_index is None:
+            return
+        if self.end is not None:
+            limit = self.end + self.size # Anche le finestre che iniziano prima di end e finiscono dopo
+        else:
+            limit = max((s.end for s in self.open.values()), default=self.origin + self.next_index * self.step)
+        self._emit_until(limit)
+
+
+def _command_of(line):
+    from decode_json import command_of
+    return command_of(line)
+
+
+def aggregate(paths, size, step=None, start=None, end=None, on_window=None, decode=True):
+    """Scorre i messaggi dei file nella finestra [start, end) e ritorna l'aggregatore finale."""
+    import decode_json
+    decode_json.VERBOSE = False
+
+    aggregator = WindowAggregator(size, step, origin=start, end=end, on_window=on_window)
+    for t, record in iter_messages(paths, start, end):
+        aggregator.add(t, record, decode_json.decode_record(record) if decode else None)
+    aggregator.finish()
+    return aggregator
+
+
+def format_window(stats, top=5, effect_name=None):
+    """Riga (più dettagli) di una finestra per la console."""
+    start = datetime.fromtimestamp(stats.start).strftime("%Y-%m-%d %H:%M:%S")
+    end = datetime.fromtimestamp(stats.end).strftime("%H:%M:%S")
+    lines = [f"🕒 {start} → {end} | {stats.messages} msg | {stats.bytes / 1024:.1f} KB"]
+    if stats.commands:
+        lines.append("   comandi: " + ", ".join(f"{c} {n}" for c, n in stats.commands.most_common(top)))
+    if stats.changes:
+        lines.append("   roster:  " + ", ".join(f"{k} {n}" for k, n in sorted(stats.changes.items())))
+    if stats.effects:
+        best = sorted(stats.effects.items(), key=lambda kv: -kv[1])[:top]
+        name = effect_name or str
+        lines.append("   effetti: " + ", ".join(f"{name(k)} {v:g}" for k, v in best))
+    return "\n".join(lines)
+
+
+# =============================
+#   CLI
+# =============================
+
+def main(argv=None):
+    import decode_json
+
+    parser = argparse.ArgumentParser(description="Statistiche per finestre temporali sulle catture ricostruite")
+    parser.add_argument("files", nargs="*", help="File di cattura (default: tutti quelli della cartella)")
+    parser.add_argument("--dir", default=decode_json.REASSEMBLED_DIR, help="Cartella delle catture")
+    parser.add_argument("--start", help="Inizio: ISO (2026-10-17T14:00) oppure HH:MM con --day")
+    parser.add_argument("--end", help="Fine (esclusa), stesso formato di --start")
+    parser.add_argument("--day", help="Giorno per gli orari HH:MM (default: oggi)")
+    parser.add_argument("--size", default="5m", help="Durata della finestra (es. 30s, 5m, 1h)")
+    parser.add_argument("--step", help="Passo delle finestre scorrevoli (default: uguale a --size)")
+    parser.add_argument("--no-decode", action="store_true", help="Solo conteggi e byte, senza roster ed effetti")
+    parser.add_argument("--output", help="Salva le finestre in JSONL")
+    args = parser.parse_args(argv)
+
+    start = parse_time(args.start, args.day) if args.start else None
+    end = parse_time(args.end, args.day) if args.end else None
+    size = parse_duration(args.size)
+    step = parse_duration(args.step) if args.step else None
+    paths = args.files or list_capture_files(args.dir)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    count = 0
+
+    def on_window(stats):
+        nonlocal count
+        count += 1
+        print(format_window(stats, effect_name=decode_json.effect_name))
+        if out:
+            out.write(json.dumps(stats.to_dict(), ensure_ascii=False) + "\n")
+
+    try:
+        aggregator = aggregate(paths, size, step, start, end, on_window, decode=not args.no_decode)
+    finally:
+        if out:
+            out.close()
+
+    print(f"\n📊 {count} finestre da {timedelta(seconds=size)}"
+          + (f" ogni {timedelta(seconds=step)}" if step else "")
+          + (f", {aggregator.late} messaggi fuori ordine" if aggregator.late else ""))
+    if out:
+        print(f"💾 Finestre salvate in {args.output}")
+
+
+if __name__ == "__main__":
+    main()